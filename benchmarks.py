@@ -0,0 +1,901 @@
+"""Benchmarks, load tests and the multi-process stress test for habit tracker.py.
+
+Run ``python benchmarks.py --help`` for the commands. The app is loaded as
+the module ``habit_tracker``; commands that need a fresh process (startup,
+load and stress workers, the API server) start one.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "habit tracker.py")
+STARTUP_READY_MARKER = "HABIT_TRACKER_WINDOW_READY"
+
+
+def load_app_module():
+    """Import habit tracker.py, whose file name is not importable, as habit_tracker.
+
+    It is registered in sys.modules so worker processes started by the app's
+    process pools can unpickle its functions.
+    """
+    module = sys.modules.get("habit_tracker")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("habit_tracker", APP_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["habit_tracker"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+load_app_module()
+from habit_tracker import (  # noqa: E402
+    HABITS_FILE, HEATMAP_WEEKS, SAVE_DEBOUNCE_SECONDS, CalendarView, CompletionIndex, EventLogStore, Habit,
+    HabitRegistry, HabitTrackerApp, WeeklyBarChart, aggregate_users, completion_levels, heatmap_start,
+    lazy_import, ordinal_to_iso, tk, user_dir, year_heatmap_image
+)
+
+
+async def api_request(reader, writer, method, path, body=None, headers=()):
+    """Send one request on a kept-alive connection; returns (status, headers, body bytes)."""
+    payload = b"" if body is None else json.dumps(body).encode("utf-8")
+    head = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(payload)}"]
+    head.extend(f"{name}: {value}" for name, value in headers)
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+    await writer.drain()
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    response_headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            response_headers[name.strip().lower()] = value.strip()
+    length = int(response_headers.get("content-length") or 0)
+    return int(lines[0].split(" ")[1]), response_headers, await reader.readexactly(length) if length else b""
+
+
+def run_api_benchmark(requests, concurrency, habits, write_ratio, storage):
+    """Load-test a fresh API server on localhost with a read/complete mix; print JSON.
+
+    Reads send If-None-Match with the last ETag seen, the way a polling
+    dashboard would. After the run the server is stopped and the store is
+    reloaded to check that the completion counts it served all reached disk.
+    """
+    import asyncio
+    import random
+    import subprocess
+    import tempfile
+    with tempfile.TemporaryDirectory() as workdir:
+        generate_habits_file(os.path.join(workdir, HABITS_FILE), habits, 1, 2.0)
+        server = subprocess.Popen(
+            [sys.executable, APP_SCRIPT, "--storage", storage, "--data-dir", workdir,
+             "serve", "--port", "0"],
+            cwd=workdir, stdout=subprocess.PIPE, text=True
+        )
+        try:
+            url = server.stdout.readline().strip().rsplit("/", 1)[-1]
+            host, port = url.rsplit(":", 1)
+
+            async def main():
+                reader, writer = await asyncio.open_connection(host, int(port))
+                _, _, body = await api_request(reader, writer, "GET", "/habits")
+                ids = [h["id"] for h in json.loads(body)]
+                _, _, body = await api_request(reader, writer, "GET", "/status")
+                writes_before = json.loads(body)["diskWrites"]
+                latencies, statuses, completions = [], {}, [0]
+
+                async def client(count):
+                    rng = random.Random(count)
+                    conn = await asyncio.open_connection(host, int(port))
+                    etag = None
+                    for _ in range(count):
+                        started = time.perf_counter()
+                        if rng.random() < write_ratio:
+                            status, _, _ = await api_request(*conn, "POST", f"/habits/{rng.choice(ids)}/complete", {})
+                            completions[0] += status == 200
+                        else:
+                            status, headers, _ = await api_request(
+                                *conn, "GET", "/habits", headers=[("If-None-Match", etag)] if etag else ()
+                            )
+                            etag = headers.get("etag", etag)
+                        latencies.append(time.perf_counter() - started)
+                        statuses[status] = statuses.get(status, 0) + 1
+                    conn[1].close()
+
+                started = time.perf_counter()
+                share, extra = divmod(requests, concurrency)
+                await asyncio.gather(*(client(share + (i < extra)) for i in range(concurrency)))
+                elapsed = time.perf_counter() - started
+                await asyncio.sleep(SAVE_DEBOUNCE_SECONDS * 2)  # Let the last coalesced save land
+                _, _, body = await api_request(reader, writer, "GET", "/status")
+                writes = json.loads(body)["diskWrites"] - writes_before
+                _, _, body = await api_request(reader, writer, "GET", "/habits")
+                served_total = sum(h["completionCount"] for h in json.loads(body))
+                writer.close()
+                latencies.sort()
+                return {
+                    "requests": len(latencies),
+                    "concurrency": concurrency,
+                    "seconds": round(elapsed, 3),
+                    "requests_per_second": round(len(latencies) / elapsed, 1),
+                    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+                    "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+                    "statuses": {str(k): v for k, v in sorted(statuses.items())},
+                    "completions": completions[0],
+                    "disk_writes": writes,
+                    "served_total": served_total
+                }
+
+            report = asyncio.run(main())
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            app = HabitTrackerApp(None, storage=storage, interactive=False)
+            report["persisted_total"] = sum(h.completion_count for h in app.each_time_habits + app.daily_habits)
+            app.close_storage()
+        finally:
+            os.chdir(cwd)
+    print(json.dumps(report, indent=2))
+    return 0 if report["persisted_total"] == report["served_total"] else 1
+
+
+def run_startup_probe(directory):
+    """Start the app the way its GUI does and report the moment the first window is on screen."""
+    root = tk.Tk()
+    HabitTrackerApp(root, directory=directory)
+    root.update()
+    print(STARTUP_READY_MARKER, flush=True)
+    root.destroy()
+
+
+def measure_startup(mode, directory):
+    """Time one cold start over the habits in directory in a fresh interpreter.
+
+    Returns (ms, {module: cumulative us}).
+    """
+    import subprocess
+    if mode == "gui":
+        args = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--startup-probe", directory]
+        marker = STARTUP_READY_MARKER
+    else:
+        args = [sys.executable, "-X", "importtime", APP_SCRIPT, "--data-dir", directory, "--console"]
+        marker = "Choose an option (1-7): "
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    seen = ""
+    elapsed = None
+    while True:
+        char = proc.stdout.read(1)
+        if not char:
+            break
+        seen += char
+        if seen.endswith(marker):
+            elapsed = (time.perf_counter() - started) * 1000
+            break
+    _, stderr = proc.communicate(input="7\n")
+    if elapsed is None:
+        raise RuntimeError(f"{mode} startup did not reach its first screen:\n{stderr[-500:]}")
+    imports = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = (part.strip() for part in line[len("import time:"):].split("|"))
+            if cumulative.isdigit():
+                imports[module] = int(cumulative)
+    return elapsed, imports
+
+
+def run_startup_benchmark(runs, budget_ms=None, top=15, habits=20, years=1):
+    """Measure time-to-first-window and time-to-console-prompt and print a JSON report.
+
+    Every start opens a synthetic habits file in a temporary data directory,
+    so the habits and lock in the current directory are never touched.
+    """
+    import statistics
+    import tempfile
+    report = {}
+    for mode in ("gui", "console"):
+        try:
+            samples = []
+            imports = {}
+            for _ in range(runs):
+                with tempfile.TemporaryDirectory(prefix="habit-startup-") as workdir:
+                    generate_habits_file(os.path.join(workdir, HABITS_FILE), habits, years, density=2.0)
+                    elapsed, imports = measure_startup(mode, workdir)
+                samples.append(elapsed)
+        except RuntimeError as e:
+            report[mode] = {"error": str(e)}
+            continue
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:top]
+        report[mode] = {
+            "median_ms": round(statistics.median(samples), 1),
+            "min_ms": round(min(samples), 1),
+            "samples_ms": [round(sample, 1) for sample in samples],
+            "heavy_modules_loaded": [m for m in ("matplotlib", "numpy", "pystray", "PIL") if m in imports],
+            "slowest_imports_us": dict(slowest)
+        }
+    print(json.dumps(report, indent=2))
+    if budget_ms is not None:
+        over = [mode for mode, result in report.items() if result.get("median_ms", 0) > budget_ms]
+        if over:
+            print(f"Startup budget of {budget_ms} ms exceeded for: {', '.join(over)}")
+            return 1
+    return 0
+
+
+def load_probe(path, variant):
+    """Load a snapshot one way in this process and print load time and peak RSS as JSON."""
+    import resource  # Benchmark-only and POSIX-only
+    started = time.perf_counter()
+    habits = 0
+    if variant == "json.load":
+        with open(path) as f:
+            raw = json.load(f)
+        habits = len(raw) if isinstance(raw, list) else sum(len(raw.get(k, [])) for k in ('each_time_habits', 'daily_habits'))
+    elif variant != "baseline":
+        store = EventLogStore(path, path + ".bench-log", lazy_history=(variant == "stream-lazy"))
+        data = store.load()
+        habits = len(data['each_time_habits']) + len(data['daily_habits'])
+        store.close()
+    print(json.dumps({
+        "seconds": round(time.perf_counter() - started, 4),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "habits": habits
+    }))
+
+
+def run_load_benchmark(path, runs):
+    """Compare json.load with the streaming and lazy loaders in fresh processes; print JSON."""
+    import subprocess
+    report = {"file": path, "file_bytes": os.path.getsize(path)}
+    for variant in ("baseline", "json.load", "stream", "stream-lazy"):
+        results = []
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--load-probe", path, variant],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        report[variant] = {
+            "seconds": min(r["seconds"] for r in results),
+            "peak_rss_kb": min(r["peak_rss_kb"] for r in results),
+            "habits": results[0]["habits"]
+        }
+    for variant in ("json.load", "stream", "stream-lazy"):
+        report[variant]["rss_over_baseline_kb"] = report[variant]["peak_rss_kb"] - report["baseline"]["peak_rss_kb"]
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def run_model_benchmark(count, years, rounds=20):
+    """Compare memory and access speed of dict habits against Habit objects; print JSON."""
+    import random
+    import tracemalloc
+    today = date.today().toordinal()
+    histories = [
+        [ordinal_to_iso(today - day) for day in range(years * 365, -1, -1) if random.random() < 0.6]
+        for _ in range(count)
+    ]
+
+    def build_dicts():
+        # Decoding from JSON gives every date its own str object, as json.load does
+        return [{
+            "id": str(uuid.uuid4()), "text": f"Habit {i}", "completed": False, "lastCompleted": None,
+            "completionCount": len(dates), "completionDates": json.loads(json.dumps(dates))
+        } for i, dates in enumerate(histories)]
+
+    def build_habits():
+        return [Habit.from_dict(d) for d in build_dicts()]
+
+    report = {"habits": count, "years": years}
+    for name, build in (("dict", build_dicts), ("Habit", build_habits)):
+        tracemalloc.start()
+        habits = build()
+        current, _ = tracemalloc.get_traced_memory()  # Temporaries freed by now are not counted
+        tracemalloc.stop()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            if name == "dict":
+                for h in habits:
+                    _ = (h["text"], h["completed"] and h["completionCount"])
+            else:
+                for h in habits:
+                    _ = (h.text, h.completed and h.completion_count)
+        access = (time.perf_counter() - started) / (rounds * count)
+        report[name] = {
+            "bytes_per_habit": current // count,
+            "row_access_ns": round(access * 1e9, 1)
+        }
+        del habits
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def generate_habits_file(path, habits, years, density, daily_rate=0.7, seed=1, legacy_dates=False):
+    """Write a synthetic habits.json: even habits are daily, odd ones each-time.
+
+    Daily habits are done on a day with probability daily_rate; each-time habits
+    get about density clicks per day (exponentially distributed). Habits are
+    written one at a time, so large files need little memory. legacy_dates
+    writes the old completionDates lists instead of encoded histories.
+    """
+    import random
+    rng = random.Random(seed)
+    today = date.today().toordinal()
+    first = today - years * 365
+    written = {'each_time_habits': 0, 'daily_habits': 0}
+    with open(path, "w") as out:
+        for key in ('each_time_habits', 'daily_habits'):
+            out.write(('{"%s":[' if key == 'each_time_habits' else '],"%s":[') % key)
+            for i in range(key == 'each_time_habits', habits, 2):
+                counts = {}
+                for ordinal in range(first, today + 1):
+                    if key == 'daily_habits':
+                        count = rng.random() < daily_rate
+                    else:
+                        count = round(rng.expovariate(1 / density)) if density > 0 else 0
+                    if count:
+                        counts[ordinal] = int(count)
+                history = CompletionIndex.from_counts(counts)
+                last = ordinal_to_iso(history.ordinals[-1]) if history else None
+                habit = {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                    "text": f"Habit {i}",
+                    "completed": key == 'daily_habits' and last == ordinal_to_iso(today),
+                    "lastCompleted": last if key == 'daily_habits' else None,
+                    "completionCount": history.total()
+                }
+                if legacy_dates:
+                    habit["completionDates"] = [
+                        ordinal_to_iso(o) for o, count in zip(history.ordinals, history.counts) for _ in range(count)
+                    ]
+                else:
+                    habit["history"] = history.encode()
+                out.write(("," if written[key] else "") + json.dumps(habit, separators=(",", ":")))
+                written[key] += 1
+        out.write('],"logSeq":0}')
+    return written
+
+
+class HeadlessWidget:
+    """Stand-in for Tk widgets and images when there is no display; accepts and counts every call."""
+
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        HeadlessWidget.calls += 1
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            HeadlessWidget.calls += 1
+            return self
+        return call
+
+    def width(self):
+        return 1
+
+    def height(self):
+        return 1
+
+
+def open_bench_root():
+    """A withdrawn Tk root, starting Xvfb if there is no display; (None, None) when neither works."""
+    import shutil
+    import subprocess
+    xvfb = None
+    try:
+        if not os.environ.get("DISPLAY") and shutil.which("Xvfb"):
+            display = f":{90 + os.getpid() % 100}"
+            xvfb = subprocess.Popen(["Xvfb", display, "-nolisten", "tcp"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            os.environ["DISPLAY"] = display
+            time.sleep(0.5)
+        root = tk.Tk()
+        root.withdraw()
+        return root, xvfb
+    except tk.TclError:
+        if xvfb:
+            xvfb.terminate()
+        return None, None
+
+
+def time_runs(func, runs):
+    """Run func runs times; return median/min/max wall time in ms."""
+    import statistics
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3)
+    }
+
+
+def bench_rendering(app, runs, sample):
+    """Time the weekly chart, calendar spans and year heatmap, on Tk if possible, else headless."""
+    import types
+    results = {}
+    root, xvfb = open_bench_root()
+    widgets = tk if root else types.SimpleNamespace(
+        Frame=HeadlessWidget, Button=HeadlessWidget, Canvas=HeadlessWidget, PhotoImage=HeadlessWidget
+    )
+    try:
+        results["backend"] = "tk" if root else "headless-stub"
+        parent = tk.Frame(root) if root else HeadlessWidget()
+
+        def settle():
+            if root:
+                root.update_idletasks()
+
+        figure_module = lazy_import("matplotlib.figure")
+        agg = lazy_import("matplotlib.backends.backend_agg")
+        if figure_module is None or agg is None:
+            results["chart"] = {"skipped": "matplotlib is not installed"}
+        else:
+            if root:
+                backend = lazy_import("matplotlib.backends.backend_tkagg")
+            else:
+                class HeadlessCanvas(agg.FigureCanvasAgg):
+                    def __init__(self, figure, master=None):
+                        super().__init__(figure)
+
+                    def get_tk_widget(self):
+                        return HeadlessWidget()
+
+                    def blit(self, bbox=None):
+                        pass
+                backend = types.SimpleNamespace(FigureCanvasTkAgg=HeadlessCanvas)
+            chart = WeeklyBarChart(parent, figure_module, backend)
+            each_time = app.each_time_habits[:sample]
+
+            def draw_charts():
+                app.weekly_cache.clear()
+                for habit in each_time:
+                    frequencies, labels = app.weekly_frequencies(habit)
+                    chart.update(habit.text, frequencies, labels, [0, 2, 4, 6], "#14B8A6")
+                settle()
+            results["chart"] = time_runs(draw_charts, runs)
+            results["chart"]["habits"] = len(each_time)
+
+        view = CalendarView(parent, widgets)
+        daily = app.daily_habits[:sample]
+        for name, months in (("calendar_month", 1), ("calendar_year", 12)):
+            def draw_calendars():
+                view.months = months
+                for habit in daily:
+                    view.show(habit.text, app.completion_index(habit), "#4B5EAA")
+                settle()
+            results[name] = time_runs(draw_calendars, runs)
+            results[name]["habits"] = len(daily)
+
+        habits = app.daily_habits + app.each_time_habits
+        today = date.today()
+        start = heatmap_start(today)
+
+        def draw_heatmap():
+            levels = [
+                completion_levels(app.completion_index(h), start.toordinal(), HEATMAP_WEEKS * 7,
+                                  4 if app.registry.mode_of(h) == 'same_day' else 1)
+                for h in habits
+            ]
+            year_heatmap_image(levels, today.toordinal(), start.toordinal(), CalendarView.HEATMAP_CELL, widgets)
+            settle()
+        results["year_heatmap"] = time_runs(draw_heatmap, runs)
+        results["year_heatmap"]["habits"] = len(habits)
+    finally:
+        if root:
+            root.destroy()
+        if xvfb:
+            xvfb.terminate()
+    return results
+
+
+def run_benchmark_suite(habits, years, density, daily_rate, runs, storage, seed=1, output=None, compare=None):
+    """Generate a dataset and time loading, saving, toggling, deleting, stats and rendering; print JSON."""
+    import platform
+    import random
+    import shutil
+    import tempfile
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix="habit-bench-")
+    cwd = os.getcwd()
+    results = {}
+    try:
+        os.chdir(workdir)
+        started = time.perf_counter()
+        generate_habits_file(HABITS_FILE, habits, years, density, daily_rate, seed)
+        generated_s = time.perf_counter() - started
+        dataset = {"habits": habits, "years": years, "density": density, "daily_rate": daily_rate,
+                   "seed": seed, "bytes": os.path.getsize(HABITS_FILE), "generate_s": round(generated_s, 2)}
+        pristine = HABITS_FILE + ".orig"
+        shutil.copy(HABITS_FILE, pristine)
+        HabitTrackerApp(None, SAVE_DEBOUNCE_SECONDS, storage, interactive=False).close_storage()  # SQLite migrates once here
+
+        apps = []
+
+        def load():
+            apps.append(HabitTrackerApp(None, SAVE_DEBOUNCE_SECONDS, storage, interactive=False))
+        results["load"] = time_runs(load, runs)
+        for app in apps[:-1]:
+            app.close_storage()
+        app = apps[-1]
+
+        def save():
+            app.save_habits()
+            app.saver.flush()
+        results["save"] = time_runs(save, runs)
+
+        sample = rng.sample(app.each_time_habits + app.daily_habits, min(1000, habits))
+        started = time.perf_counter()
+        for habit in sample:
+            app.increment_mode = app.registry.mode_of(habit)
+            app.toggle_habit_completion(habit.uid)
+        toggled = time.perf_counter() - started
+        results["toggle"] = {"ops": len(sample), "mean_us": round(toggled / len(sample) * 1e6, 2),
+                             "flush_ms": round(time_runs(app.saver.flush, 1)["median_ms"], 3)}
+
+        doomed = sample[:max(1, min(100, len(sample) // 10))]  # Leave most habits for the later benchmarks
+        started = time.perf_counter()
+        for habit in doomed:
+            app.delete_habit(habit.uid)
+        deleted = time.perf_counter() - started
+        results["delete"] = {"ops": len(doomed), "mean_us": round(deleted / len(doomed) * 1e6, 2),
+                             "flush_ms": round(time_runs(app.saver.flush, 1)["median_ms"], 3)}
+
+        if lazy_import("numpy") is None:
+            results["stats"] = {"skipped": "numpy is not installed"}
+        else:
+            def stats():
+                app.data_version += 1  # Defeat the per-version cache
+                app.analytics()
+            results["stats"] = time_runs(stats, runs)
+
+        def weekly():
+            app.weekly_cache.clear()
+            for habit in app.each_time_habits:
+                app.weekly_frequencies(habit)
+        results["weekly_frequencies"] = time_runs(weekly, runs)
+
+        results["render"] = bench_rendering(app, runs, min(50, habits // 2))
+        app.close_storage()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "storage": storage,
+            "runs": runs,
+            "timestamp": datetime.now().isoformat(timespec="seconds")
+        },
+        "dataset": dataset,
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if compare:
+        with open(compare) as f:
+            print_benchmark_comparison(json.load(f)["results"], results)
+    return 0
+
+
+def benchmark_metrics(results, prefix=""):
+    """Flatten a results tree to {name: headline number} (median_ms, else mean_us)."""
+    metrics = {}
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        for unit in ("median_ms", "mean_us"):
+            if unit in value:
+                metrics[f"{prefix}{name} ({unit})"] = value[unit]
+                break
+        else:
+            metrics.update(benchmark_metrics(value, f"{prefix}{name}."))
+    return metrics
+
+
+def print_benchmark_comparison(before, after):
+    """Print each metric of two benchmark runs side by side with the after/before ratio."""
+    old, new = benchmark_metrics(before), benchmark_metrics(after)
+    print(f"{'metric':<36}{'before':>12}{'after':>12}{'ratio':>8}")
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name] / old[name] if old[name] else float("inf")
+        print(f"{name:<36}{old[name]:>12.3f}{new[name]:>12.3f}{ratio:>8.2f}")
+
+
+def run_registry_benchmark(count, operations=1000):
+    """Time id lookup, toggle and delete through HabitRegistry against list scans; print JSON."""
+    import random
+    habits = [Habit(str(uuid.uuid4()), f"Habit {i}", history=CompletionIndex()) for i in range(count)]
+    targets = [h.uid for h in random.sample(habits, min(operations, count))]
+    scan_targets = targets[:max(1, len(targets) // 10)]  # Scans are slow; a sample is enough
+
+    def per_op(run, keys):
+        started = time.perf_counter()
+        for key in keys:
+            run(key)
+        return round((time.perf_counter() - started) / len(keys) * 1e6, 2)
+
+    def scan_lookup(uid):
+        return next(h for h in scan_list if h.uid == uid)
+
+    def scan_toggle(uid):
+        habit = scan_lookup(uid)
+        habit.completed = not habit.completed
+
+    def scan_delete(uid):
+        scan_list[:] = [h for h in scan_list if h.uid != uid]
+
+    def registry_toggle(uid):
+        habit, _ = registry.get(uid)
+        habit.completed = not habit.completed
+
+    scan_list = list(habits)
+    registry = HabitRegistry(daily=habits)
+    report = {"habits": count, "list_scan_us": {}, "registry_us": {}}
+    for name, scan, indexed in (("lookup", scan_lookup, registry.get),
+                                ("toggle", scan_toggle, registry_toggle),
+                                ("delete", scan_delete, registry.remove)):
+        report["list_scan_us"][name] = per_op(scan, scan_targets)
+        report["registry_us"][name] = per_op(indexed, targets)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def run_team_benchmark(users, habits, years, storage, jobs=None):
+    """Time opening one user's shard and aggregating over many synthetic users; print JSON.
+
+    Opening a user is timed once with that user alone in the data directory
+    and once among all the others, which should cost the same.
+    """
+    import shutil
+    import tempfile
+
+    def open_user(data_dir):
+        started = time.perf_counter()
+        HabitTrackerApp(None, SAVE_DEBOUNCE_SECONDS, storage, interactive=False,
+                        directory=user_dir(data_dir, "user-0")).close_storage()
+        return round((time.perf_counter() - started) * 1000, 2)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        for i in range(users):
+            shard = user_dir(workdir, f"user-{i}")
+            os.makedirs(shard)
+            generate_habits_file(os.path.join(shard, HABITS_FILE), habits, years, 2.0, seed=i)
+        report = {"users": users, "habits_per_user": habits, "years": years, "storage": storage,
+                  "generate_s": round(time.perf_counter() - started, 2)}
+        if storage == "sqlite":
+            aggregate_users(workdir, storage, jobs=jobs)  # Each shard migrates to SQLite once here
+        alone = os.path.join(workdir, "alone")
+        shutil.copytree(user_dir(workdir, "user-0"), user_dir(alone, "user-0"))
+        report["open_user_alone_ms"] = min(open_user(alone) for _ in range(3))
+        report["open_user_among_all_ms"] = min(open_user(workdir) for _ in range(3))
+        for label, workers in (("serial", 1), ("parallel", jobs or os.cpu_count() or 1)):
+            started = time.perf_counter()
+            team = aggregate_users(workdir, storage, jobs=workers)
+            report[f"aggregate_{label}_s"] = round(time.perf_counter() - started, 3)
+            report[f"aggregate_{label}_jobs"] = workers
+        report["completion_rate"] = round(team["completion_rate"], 4)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def run_stress_worker(worker, ops, storage):
+    """One writer of the stress test: hammer the shared store, then report what it sees."""
+    import random
+    rng = random.Random(worker)
+    app = HabitTrackerApp(None, 0.005, storage, interactive=False)
+    if isinstance(app.store, EventLogStore):
+        app.store.compact_threshold = 25  # Rotate and fold often so compactions race with writers
+    shared, _ = app.find_habit("Shared each-time")
+    daily, _ = app.find_habit("Shared daily")
+    today = date.today().toordinal()
+    done = {"each_time": 0, "daily": 0, "added": 0}
+    for i in range(ops):
+        roll = rng.random()
+        if roll < 0.5:
+            app.mark_completed(shared, 'each_time', app.today)
+            done["each_time"] += 1
+        elif roll < 0.8:
+            # A past day no other write uses, so every daily completion must survive
+            app.mark_completed(daily, 'same_day', ordinal_to_iso(today - 1 - worker * ops - i))
+            done["daily"] += 1
+        else:
+            app.increment_mode = 'each_time'
+            app.add_habit(f"Worker {worker} habit {i}")
+            done["added"] += 1
+        if rng.random() < 0.2:
+            app.poll_external_changes()
+        time.sleep(rng.random() * 0.002)
+    app.saver.flush()
+    print("STRESS " + json.dumps(done), flush=True)
+    sys.stdin.readline()  # Every worker has finished writing
+    app.poll_external_changes()
+    view = {"habits": len(app.registry), "each_time": shared.completion_count, "daily": daily.completion_count}
+    print("STRESS " + json.dumps(view), flush=True)
+    app.close_storage()
+
+
+def run_stress_test(processes, ops, storage):
+    """Run writer processes against one store at once; fail if a change is lost or a view is stale."""
+    import shutil
+    import subprocess
+    import tempfile
+    script = os.path.abspath(__file__)
+    workdir = tempfile.mkdtemp(prefix="habit-stress-")
+    cwd = os.getcwd()
+    errors = []
+
+    def read_report(proc):
+        for line in proc.stdout:
+            if line.startswith("STRESS "):
+                return json.loads(line[len("STRESS "):])
+            if "Error" in line:
+                errors.append(line.strip())
+        raise RuntimeError(f"Stress worker exited with code {proc.wait()}")
+
+    def snapshot_view(app):
+        shared, _ = app.find_habit("Shared each-time")
+        daily, _ = app.find_habit("Shared daily")
+        return {"habits": len(app.registry), "each_time": shared.completion_count, "daily": daily.completion_count}
+
+    procs = []
+    try:
+        os.chdir(workdir)
+        app = HabitTrackerApp(None, 0, storage, interactive=False)
+        app.increment_mode = 'each_time'
+        app.add_habit("Shared each-time")
+        app.increment_mode = 'same_day'
+        app.add_habit("Shared daily")
+        app.close_storage()
+
+        started = time.perf_counter()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, script, "--storage", storage, "--stress-worker", str(worker), str(ops)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            for worker in range(processes)
+        ]
+        done = [read_report(proc) for proc in procs]
+        elapsed = time.perf_counter() - started
+        for proc in procs:
+            proc.stdin.write("\n")
+            proc.stdin.flush()
+        views = [read_report(proc) for proc in procs]
+        for proc in procs:
+            proc.wait()
+
+        app = HabitTrackerApp(None, 0, storage, interactive=False)
+        on_disk = snapshot_view(app)
+        app.close_storage()
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    expected = {
+        "habits": 2 + sum(d["added"] for d in done),
+        "each_time": sum(d["each_time"] for d in done),
+        "daily": sum(d["daily"] for d in done)
+    }
+    report = {
+        "storage": storage,
+        "processes": processes,
+        "ops_per_process": ops,
+        "seconds": round(elapsed, 2),
+        "ops_per_second": round(processes * ops / elapsed, 1),
+        "expected": expected,
+        "on_disk": on_disk,
+        "lost": {key: expected[key] - on_disk[key] for key in expected},
+        "stale_views": sum(view != on_disk for view in views),
+        "errors": errors[:20]
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if on_disk == expected and not report["stale_views"] and not errors else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Habit Tracker benchmarks")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json",
+                        help="storage backend to benchmark")
+    parser.add_argument("--startup-probe", metavar="DIR", help=argparse.SUPPRESS)
+    parser.add_argument("--load-probe", nargs=2, metavar=("PATH", "VARIANT"), help=argparse.SUPPRESS)
+    parser.add_argument("--stress-worker", type=int, nargs=2, metavar=("WORKER", "OPS"), help=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    command = commands.add_parser("startup", help="measure cold start time to first window and console prompt")
+    command.add_argument("--runs", type=int, default=5)
+    command.add_argument("--budget-ms", type=float, help="fail above this median")
+    command.add_argument("--habits", type=int, default=20, help="habits in the file each start opens")
+    command.add_argument("--years", type=int, default=1)
+    command = commands.add_parser("api", help="load-test a local API server with reads and completions")
+    command.add_argument("--requests", type=int, default=20000)
+    command.add_argument("--concurrency", type=int, default=32)
+    command.add_argument("--habits", type=int, default=100)
+    command.add_argument("--write-ratio", type=float, default=0.5, help="share of requests that complete a habit")
+    command = commands.add_parser("load", help="measure load time and peak memory of a habits file")
+    command.add_argument("file", nargs="?", default=HABITS_FILE)
+    command.add_argument("--runs", type=int, default=3)
+    command = commands.add_parser("model", help="compare memory and speed of dict and Habit models")
+    command.add_argument("--habits", type=int, default=1000)
+    command.add_argument("--years", type=int, default=3)
+    command = commands.add_parser("generate", help="write a synthetic habits.json for benchmarks")
+    command.add_argument("output")
+    command.add_argument("--legacy-dates", action="store_true",
+                         help="write completionDates lists (the old format) instead of encoded histories")
+    command = commands.add_parser("suite", help="time load, save, toggle, delete, stats and rendering on synthetic data")
+    command.add_argument("--runs", type=int, default=5)
+    command.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    command.add_argument("--compare", metavar="BASELINE", help="print ratios against an earlier results file")
+    for command in (commands.choices["generate"], command):
+        command.add_argument("--habits", type=int, default=500)
+        command.add_argument("--years", type=int, default=3)
+        command.add_argument("--density", type=float, default=2.0, help="mean each-time clicks per day")
+        command.add_argument("--daily-rate", type=float, default=0.7, help="share of days a daily habit is done")
+        command.add_argument("--seed", type=int, default=1)
+    command = commands.add_parser("registry", help="compare id lookups through the registry with list scans")
+    command.add_argument("--habits", type=int, default=100000)
+    command = commands.add_parser("team", help="time opening one user and aggregating over many users")
+    command.add_argument("--users", type=int, default=300)
+    command.add_argument("--habits", type=int, default=20, help="habits per user")
+    command.add_argument("--years", type=int, default=1)
+    command.add_argument("--jobs", type=int, help="worker processes for the parallel run (default: one per core)")
+    command = commands.add_parser("stress", help="run several writer processes on one store and check for lost changes")
+    command.add_argument("--processes", type=int, default=8)
+    command.add_argument("--ops", type=int, default=200, help="changes made by each process")
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        run_startup_probe(args.startup_probe)
+        sys.exit(0)
+    if args.load_probe:
+        load_probe(*args.load_probe)
+        sys.exit(0)
+    if args.stress_worker:
+        run_stress_worker(*args.stress_worker, args.storage)
+        sys.exit(0)
+    if args.command == "startup":
+        sys.exit(run_startup_benchmark(args.runs, args.budget_ms, habits=args.habits, years=args.years))
+    if args.command == "api":
+        sys.exit(run_api_benchmark(args.requests, args.concurrency, args.habits, args.write_ratio, args.storage))
+    if args.command == "load":
+        sys.exit(run_load_benchmark(args.file, args.runs))
+    if args.command == "model":
+        sys.exit(run_model_benchmark(args.habits, args.years))
+    if args.command == "generate":
+        written = generate_habits_file(
+            args.output, args.habits, args.years, args.density, args.daily_rate, args.seed, args.legacy_dates
+        )
+        print(json.dumps(dict(written, bytes=os.path.getsize(args.output))))
+        sys.exit(0)
+    if args.command == "suite":
+        sys.exit(run_benchmark_suite(args.habits, args.years, args.density, args.daily_rate, args.runs,
+                                     args.storage, args.seed, args.output, args.compare))
+    if args.command == "registry":
+        sys.exit(run_registry_benchmark(args.habits))
+    if args.command == "team":
+        sys.exit(run_team_benchmark(args.users, args.habits, args.years, args.storage, args.jobs))
+    if args.command == "stress":
+        sys.exit(run_stress_test(args.processes, args.ops, args.storage))
+    parser.print_help()
@@ -2,45 +2,2162 @@ import tkinter as tk
 from tkinter import messagebox, ttk
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import uuid
 import sys
 import math
 import calendar
-import pystray
-from PIL import Image
 import threading
+import bisect
+import importlib
+import argparse
+import time
+import atexit
+import gc
+import sqlite3
+import csv
+import base64
+import itertools
+from array import array
+from collections import OrderedDict
+from functools import lru_cache, wraps
 
 try:
-    import matplotlib.pyplot as plt
-    import numpy as np
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HABITS_FILE = "habits.json"
+HABITS_LOG_FILE = "habits.log"
+HABITS_DB_FILE = "habits.db"
+USERS_DIR = "users"  # Under the data directory, one subdirectory (shard) per user
+DATA_DIR_ENV_VAR = "HABIT_TRACKER_DATA"
+COMPACT_THRESHOLD = 500  # Log events before the snapshot is rewritten in the background
+SAVE_DEBOUNCE_SECONDS = 0.3  # Changes arriving within this window share one disk write
+VIRTUAL_LIST_THRESHOLD = 200  # Habits in one mode before the list switches to recycled rows
+VIRTUAL_ROW_HEIGHT = 46
+VIRTUAL_OVERSCAN = 4
+CHART_CACHE_SIZE = 128  # Weekly frequency vectors kept for flipping between habits
+HEATMAP_COLORS = ["#EBEDF0", "#9BE9A8", "#40C463", "#30A14E", "#216E39"]
+HEATMAP_WEEKS = 53
+EXTERNAL_POLL_MS = 2000  # How often the window checks for changes made by other processes
+DAY_CHECK_MAX_MS = 3600 * 1000  # Longest wait between date checks, in case the clock jumps or the machine sleeps
+TRAY_TEARDOWN_MS = 30 * 1000  # Hidden this long, the window's widgets and charts are destroyed to free memory
+TRAY_POLL_MS = 30 * 1000  # External change checks slow down to this while the app sits in the tray
+TRAY_MENU_HABITS = 15  # Habits of each mode offered in the tray menu
+API_PORT = 8765
+API_MAX_BODY = 1 << 20  # Largest request body the HTTP API accepts, in bytes
+API_CACHED_BODIES = 64  # GET responses kept per data version
+
+PROFILE_ENV_VAR = "HABIT_TRACKER_PROFILE"  # e.g. "1", "cpu" or "cpu,memory"
+PROFILE_FILE = "habit-profile.json"
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]  # Set bits of each byte value
+
+# matplotlib, numpy, pystray and PIL are imported on first use through lazy_import
+# so the window (or console prompt) appears without paying for them.
+_lazy_modules = {}
+
+
+def lazy_import(name):
+    """Import a heavy optional module the first time it is needed; None if it is unavailable."""
+    if name not in _lazy_modules:
+        try:
+            _lazy_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _lazy_modules[name] = None
+    return _lazy_modules[name]
+
+
+class Instrumentation:
+    """Timing spans and counters for the hot paths, with optional cProfile and tracemalloc capture.
+
+    Nothing is collected until ``enable`` is called (HABIT_TRACKER_PROFILE or
+    --profile); until then ``timed`` wrappers and ``count`` cost one attribute
+    check. ``report`` gathers everything as a dict for the JSON export and the
+    debug panel. cProfile only sees the main thread.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = {}  # name -> [calls, total seconds, slowest call in seconds]
+        self.counters = {}
+        self.profiler = None
+        self.tracing_memory = False
+        self.export_path = None
+        self._lock = threading.Lock()
+
+    def enable(self, options="spans", export_path=PROFILE_FILE):
+        """Start collecting. options is a comma list: spans (always on), cpu and memory."""
+        wanted = {option.strip() for option in options.split(",")}
+        self.enabled = True
+        if "cpu" in wanted and self.profiler is None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if "memory" in wanted and not self.tracing_memory:
+            import tracemalloc
+            tracemalloc.start(10)
+            self.tracing_memory = True
+        if export_path and self.export_path is None:
+            atexit.register(self.export)
+        self.export_path = export_path or self.export_path
+
+    def timed(self, name):
+        """Decorator recording every call of the function as a span called name."""
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def record(self, name, seconds):
+        """Add one call of seconds to the span called name; ignored until enabled."""
+        if not self.enabled:
+            return
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                span[0] += 1
+                span[1] += seconds
+                span[2] = max(span[2], seconds)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """Forget everything collected so far and keep collecting."""
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.clear()
+            self.profiler.enable()
+        if self.tracing_memory:
+            import tracemalloc
+            tracemalloc.clear_traces()
+
+    def report(self, top=15):
+        """Spans, counters and, when captured, the top CPU functions and memory allocation sites."""
+        with self._lock:
+            spans = {
+                name: {
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 3),
+                    "mean_ms": round(total / calls * 1000, 3),
+                    "max_ms": round(slowest * 1000, 3)
+                }
+                for name, (calls, total, slowest) in sorted(self.spans.items())
+            }
+            report = {"enabled": self.enabled, "spans": spans, "counters": dict(sorted(self.counters.items()))}
+        if self.profiler:
+            import pstats
+            stats = pstats.Stats(self.profiler).stats  # Building the stats stops the profiler
+            self.profiler.enable()
+            slowest = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            report["cpu"] = [
+                {"function": f"{os.path.basename(path)}:{line}({func})", "calls": calls,
+                 "own_ms": round(own * 1000, 3), "cumulative_ms": round(cumulative * 1000, 3)}
+                for (path, line, func), (_, calls, own, cumulative, _) in slowest
+            ]
+        if self.tracing_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            sites = tracemalloc.take_snapshot().statistics("lineno")[:top]
+            report["memory"] = {
+                "current_kb": current // 1024,
+                "peak_kb": peak // 1024,
+                "top": [{"where": str(site.traceback[0]), "kb": round(site.size / 1024, 1), "blocks": site.count}
+                        for site in sites]
+            }
+        return report
+
+    def export(self, path=None):
+        """Write the report as JSON to path (default: the export path given to enable)."""
+        path = path or self.export_path
+        try:
+            with open(path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+        except Exception as e:
+            print(f"Error exporting profile: {e}")
+        return path
+
+
+instruments = Instrumentation()
+if os.environ.get(PROFILE_ENV_VAR):
+    instruments.enable(os.environ[PROFILE_ENV_VAR], os.environ.get("HABIT_TRACKER_PROFILE_OUT", PROFILE_FILE))
+
+
+def format_report(report):
+    """Plain-text tables of an Instrumentation report, for the debug panel."""
+    if not report["enabled"]:
+        return f"Instrumentation is off. Start with --profile or {PROFILE_ENV_VAR}=1, or press Start.\n"
+    lines = [f"{'span':<16}{'calls':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}"]
+    for name, span in report["spans"].items():
+        lines.append(
+            f"{name:<16}{span['calls']:>7}{span['total_ms']:>11.1f}{span['mean_ms']:>10.2f}{span['max_ms']:>10.2f}"
+        )
+    lines += ["", "counters"] + [f"  {name:<22}{value:>12}" for name, value in report["counters"].items()]
+    if "cpu" in report:
+        lines += ["", "cpu (cumulative ms)"]
+        lines += [f"  {row['cumulative_ms']:>10.1f}  {row['function']}" for row in report["cpu"]]
+    if "memory" in report:
+        memory = report["memory"]
+        lines += ["", f"memory: {memory['current_kb']} KB now, {memory['peak_kb']} KB peak"]
+        lines += [f"  {row['kb']:>10.1f} KB  {row['where']}" for row in memory["top"]]
+    return "\n".join(lines) + "\n"
+
+
+def widget_count(widget):
+    """Number of Tk widgets in the tree under widget, itself included."""
+    return 1 + sum(widget_count(child) for child in widget.winfo_children())
+
+
+def trim_heap():
+    """Hand freed heap pages back to the OS where the C library allows it (glibc), so RSS drops."""
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def map_in_batches(func, items, jobs, *args, initializer=None, initargs=()):
+    """Call func(batch, *args) on batches of items in a pool of jobs processes; return the joined lists.
+
+    func returns a list per batch, and the results keep the order of items.
+    A few batches per worker even out the load. With one job everything
+    runs in this process.
+    """
+    if jobs <= 1:
+        if initializer:
+            initializer(*initargs)
+        return func(items, *args)
+    import concurrent.futures
+    size = max(1, math.ceil(len(items) / (jobs * 4)))
+    batches = [items[i:i + size] for i in range(0, len(items), size)]
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=initializer, initargs=initargs) as pool:
+        for batch in pool.map(func, batches, *(itertools.repeat(arg) for arg in args)):
+            results.extend(batch)
+    return results
+
+
+def apply_habit_event(data, index, event):
+    """Apply one logged event to raw habits data; index maps id -> (habit, list key).
+
+    "import" carries many dates for one habit and behaves like one "complete"
+    per date.
+    """
+    op = event.get("op")
+    if op == "add":
+        key = 'each_time_habits' if event.get("mode") == 'each_time' else 'daily_habits'
+        habit = event["habit"]
+        data[key].append(habit)
+        index[habit["id"]] = (habit, key)
+        return
+    entry = index.get(event.get("id"))
+    if entry is None:
+        return
+    habit, key = entry
+    if op == "delete":
+        data[key][:] = [h for h in data[key] if h["id"] != habit["id"]]
+        del index[habit["id"]]
+    elif op in ("complete", "import"):
+        days = event["dates"] if op == "import" else [event["date"]]
+        history = raw_history(habit)
+        if not days:
+            return
+        if key == 'each_time_habits':
+            habit["completionCount"] = habit.get("completionCount", 0) + len(days)
+            for day in days:
+                history.add(iso_to_ordinal(day))
+        else:
+            latest = max(days)
+            if not habit.get("lastCompleted") or habit["lastCompleted"] <= latest:
+                # Backfilled past days must not hide today's completion
+                habit["completed"] = True
+                habit["lastCompleted"] = latest
+            for day in days:
+                ordinal = iso_to_ordinal(day)
+                if ordinal not in history:
+                    habit["completionCount"] = habit.get("completionCount", 0) + 1
+                    history.add(ordinal)
+    elif op == "uncomplete":
+        history = raw_history(habit)
+        habit["completed"] = False
+        habit["lastCompleted"] = None
+        if history.remove(iso_to_ordinal(event["date"])):
+            habit["completionCount"] = habit.get("completionCount", 0) - 1
+
+
+class CompletionIndex:
+    """Completion history of one habit as run-length (day, count) pairs.
+
+    ``ordinals`` holds the sorted date ordinals of the days with completions
+    and ``counts`` the completions on each, as two parallel arrays: eight
+    bytes per active day however many clicks it had. Membership, per-day
+    counts and date range queries bisect ``ordinals`` in O(log n); recording
+    today, the common case, appends or bumps the last run in O(1).
+
+    On disk a history is stored by ``encode`` as a day bitmap when no day
+    has more than one completion (every daily habit) and as run-length pairs
+    otherwise; ``from_habit`` also reads the old completionDates list.
+    """
+
+    __slots__ = ("ordinals", "counts")
+
+    def __init__(self, ordinals=()):
+        counts = {}
+        for ordinal in ordinals:
+            counts[ordinal] = counts.get(ordinal, 0) + 1
+        self.ordinals = array('i', sorted(counts))
+        self.counts = array('I', [counts[o] for o in self.ordinals])
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Build an index straight from a {date ordinal: completions} mapping."""
+        index = cls()
+        index.ordinals = array('i', sorted(counts))
+        index.counts = array('I', [counts[o] for o in index.ordinals])
+        return index
+
+    @classmethod
+    def from_habit(cls, data):
+        """History of a habits.json entry in either format; None if the entry carries none."""
+        history = data.get("history")
+        if isinstance(history, cls):
+            return history
+        if history is not None:
+            return cls.decode(history)
+        dates = data.get("completionDates")
+        return None if dates is None else cls(map(iso_to_ordinal, dates))
+
+    @classmethod
+    def decode(cls, encoded):
+        """Rebuild an index from the output of ``encode``."""
+        index = cls()
+        if not encoded:
+            return index
+        start = iso_to_ordinal(encoded["start"])
+        if "days" in encoded:
+            bitmap = base64.b64decode(encoded["days"])
+            index.ordinals = array('i', [
+                start + 8 * i + bit for i, byte in enumerate(bitmap) if byte for bit in BYTE_BITS[byte]
+            ])
+            index.counts = array('I', [1]) * len(index.ordinals)
+        else:
+            runs = encoded["runs"]
+            index.ordinals = array('i', itertools.accumulate(runs[0::2], initial=start))[1:]
+            index.counts = array('I', runs[1::2])
+        return index
+
+    def encode(self):
+        """The JSON form stored in habits.json, {} for an empty history.
+
+        {"start": day, "days": base64} is a bitmap where bit i (least
+        significant first) marks start + i days; {"start": day, "runs": [gap,
+        count, ...]} lists each day as the days since the previous one and its
+        completions. The bitmap is used when every day has one completion and
+        the days are dense enough for it to be the smaller of the two.
+        """
+        if not self.ordinals:
+            return {}
+        start = self.ordinals[0]
+        span = self.ordinals[-1] - start + 1
+        if span < 24 * len(self.ordinals) and max(self.counts) == 1:
+            bitmap = bytearray((span + 7) // 8)
+            for ordinal in self.ordinals:
+                offset = ordinal - start
+                bitmap[offset >> 3] |= 1 << (offset & 7)
+            return {"start": ordinal_to_iso(start), "days": base64.b64encode(bitmap).decode("ascii")}
+        runs = [0] * (2 * len(self.ordinals))
+        runs[0::2] = [b - a for a, b in zip(itertools.chain((start,), self.ordinals), self.ordinals)]
+        runs[1::2] = self.counts
+        return {"start": ordinal_to_iso(start), "runs": runs}
+
+    def __contains__(self, ordinal):
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        return i < len(self.ordinals) and self.ordinals[i] == ordinal
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __eq__(self, other):
+        return isinstance(other, CompletionIndex) and self.ordinals == other.ordinals and self.counts == other.counts
+
+    def count(self, ordinal):
+        """Number of completions recorded on the given day."""
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        return self.counts[i] if i < len(self.ordinals) and self.ordinals[i] == ordinal else 0
+
+    def total(self):
+        """Completions on all days together."""
+        return sum(self.counts)
+
+    def add(self, ordinal):
+        """Record one completion on the given day."""
+        if self.ordinals and ordinal >= self.ordinals[-1]:
+            i = len(self.ordinals) - (ordinal == self.ordinals[-1])
+        else:
+            i = bisect.bisect_left(self.ordinals, ordinal)
+        if i < len(self.ordinals) and self.ordinals[i] == ordinal:
+            self.counts[i] += 1
+        else:
+            self.ordinals.insert(i, ordinal)
+            self.counts.insert(i, 1)
+
+    def remove(self, ordinal):
+        """Remove one completion from the given day; returns False if there was none."""
+        i = bisect.bisect_left(self.ordinals, ordinal)
+        if i == len(self.ordinals) or self.ordinals[i] != ordinal:
+            return False
+        if self.counts[i] > 1:
+            self.counts[i] -= 1
+        else:
+            del self.ordinals[i]
+            del self.counts[i]
+        return True
+
+    def days_between(self, start, end):
+        """Sorted ordinals of the days with completions in [start, end]."""
+        lo = bisect.bisect_left(self.ordinals, start)
+        hi = bisect.bisect_right(self.ordinals, end)
+        return self.ordinals[lo:hi]
+
+    def runs_between(self, start, end):
+        """(ordinal, count) of the days with completions in [start, end], oldest first."""
+        lo = bisect.bisect_left(self.ordinals, start)
+        hi = bisect.bisect_right(self.ordinals, end)
+        return zip(self.ordinals[lo:hi], self.counts[lo:hi])
+
+    def count_between(self, start, end):
+        """Total completions in [start, end]."""
+        lo = bisect.bisect_left(self.ordinals, start)
+        hi = bisect.bisect_right(self.ordinals, end)
+        return sum(self.counts[lo:hi])
+
+    def current_streak(self, today):
+        """Consecutive days with completions up to today, or up to yesterday while today has none."""
+        i = bisect.bisect_right(self.ordinals, today) - 1
+        if i < 0 or self.ordinals[i] < today - 1:
+            return 0
+        first = i
+        while i > 0 and self.ordinals[i - 1] == self.ordinals[i] - 1:
+            i -= 1
+        return first - i + 1
+
+
+def encode_json_value(value):
+    """json.dumps default hook: raw habits may carry a decoded CompletionIndex as their history."""
+    if isinstance(value, CompletionIndex):
+        return value.encode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def raw_history(habit):
+    """The CompletionIndex of a raw habit dict, decoded once and kept in place of its stored form."""
+    history = CompletionIndex.from_habit(habit)
+    habit.pop("completionDates", None)
+    habit["history"] = history if history is not None else CompletionIndex()
+    return habit["history"]
+
+
+@lru_cache(maxsize=1 << 16)
+def iso_to_ordinal(day):
+    """Ordinal of an ISO date string; cached because histories repeat the same days."""
+    return date.fromisoformat(day).toordinal()
+
+
+@lru_cache(maxsize=1 << 16)
+def ordinal_to_iso(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def habit_uid(habit_id):
+    """Canonical UUID strings become their 16 raw bytes; any other id is kept as given."""
+    if len(habit_id) == 36 and habit_id.count("-") == 4 and habit_id == habit_id.lower():
+        try:
+            raw = bytes.fromhex(habit_id.replace("-", ""))
+        except ValueError:
+            return habit_id
+        if len(raw) == 16 and uid_to_str(raw) == habit_id:
+            return raw
+    return habit_id
+
+
+def uid_to_str(uid):
+    if isinstance(uid, bytes):
+        h = uid.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+    return uid
+
+
+class Habit:
+    """A habit with slot attributes instead of a dict of string keys.
+
+    ``uid`` is the id as 16 UUID bytes (or the original string for non-UUID
+    ids) and is the key used everywhere in memory; ``id`` gives the string
+    form used on disk. ``history`` is the CompletionIndex of its completions,
+    or None while a lazily loaded habit has not fetched it yet.
+    ``to_dict``/``from_dict`` keep the habits.json schema.
+    """
+
+    __slots__ = ("uid", "text", "completed", "last_completed", "completion_count", "history")
+
+    def __init__(self, habit_id, text, completed=False, last_completed=None, completion_count=0, history=None):
+        self.uid = habit_uid(habit_id)
+        self.text = text
+        self.completed = completed
+        self.last_completed = last_completed
+        self.completion_count = completion_count
+        self.history = history
+
+    @property
+    def id(self):
+        return uid_to_str(self.uid)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Habit from a habits.json entry; one without history or completionDates is not loaded yet."""
+        return cls(
+            data["id"], data["text"], bool(data.get("completed", False)), data.get("lastCompleted"),
+            data.get("completionCount", 0), CompletionIndex.from_habit(data)
+        )
+
+    def to_dict(self):
+        """The habits.json entry for this habit (its history must be loaded)."""
+        return {
+            "id": self.id,
+            "text": self.text,
+            "completed": self.completed,
+            "lastCompleted": self.last_completed,
+            "completionCount": self.completion_count,
+            "history": self.history.encode()
+        }
+
+    def update_from(self, other):
+        """Take the text, status and history of a newer copy of this habit."""
+        self.text = other.text
+        self.completed = other.completed
+        self.last_completed = other.last_completed
+        self.completion_count = other.completion_count
+        self.history = other.history
+
+    def add_completion(self, ordinal):
+        self.completion_count += 1
+        self.history.add(ordinal)
+
+    def remove_completion(self, ordinal):
+        """Drop one completion on the given day, if there is one."""
+        if self.history.remove(ordinal):
+            self.completion_count -= 1
+
+
+class JsonStream:
+    """Minimal pull parser over a JSON file that decodes one value at a time.
+
+    Only the current value and one read chunk are held in memory, and byte
+    offsets of every decoded value are tracked so it can be re-read later.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""  # Decoded text not consumed yet
+        self.raw = b""  # Bytes of a UTF-8 sequence split across reads
+        self.offset = 0  # File byte offset of buf[0]
+        self.eof = False
+
+    def _fill(self, size):
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+            return
+        data = self.raw + data
+        try:
+            text = data.decode("utf-8")
+            self.raw = b""
+        except UnicodeDecodeError as e:
+            if e.start < len(data) - 3:
+                raise
+            text = data[:e.start].decode("utf-8")
+            self.raw = data[e.start:]
+        self.buf += text
+
+    def _consume(self, chars):
+        self.offset += len(self.buf[:chars].encode("utf-8"))
+        self.buf = self.buf[chars:]
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ('' at end of file)."""
+        while True:
+            stripped = self.buf.lstrip()
+            self._consume(len(self.buf) - len(stripped))
+            if self.buf or self.eof:
+                return self.buf[:1]
+            self._fill(self.chunk_size)
+
+    def take(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at byte {self.offset}")
+        self._consume(1)
+
+    def value(self):
+        """Decode the next value; returns (value, start byte, end byte)."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf)
+                if end < len(self.buf) or self.eof:
+                    break  # A number running into the end of the buffer may continue
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            size *= 2  # Large values are re-decoded O(log n) times, not once per chunk
+        start = self.offset
+        self._consume(end)
+        return value, start, self.offset
+
+    def array_items(self):
+        """Yield (value, start, end) for each element of the array at the current position."""
+        self.take("[")
+        if self.peek() == "]":
+            self._consume(1)
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._consume(1)
+            else:
+                self.take("]")
+                return
+
+
+def iter_snapshot(f):
+    """Yield ('habit', list key, habit, start, end) or ('logSeq', seq) from a snapshot file, streaming.
+
+    Handles both the current dict format and the legacy flat list of daily habits.
+    """
+    stream = JsonStream(f)
+    first = stream.peek()
+    if first == "[":
+        for habit, start, end in stream.array_items():
+            if isinstance(habit, dict) and "id" in habit and "text" in habit:
+                yield "habit", 'daily_habits', habit, start, end
+        return
+    stream.take("{")
+    while stream.peek() not in ("}", ""):
+        key, _, _ = stream.value()
+        stream.take(":")
+        if key in ('each_time_habits', 'daily_habits') and stream.peek() == "[":
+            for habit, start, end in stream.array_items():
+                yield "habit", key, habit, start, end
+        else:
+            value, _, _ = stream.value()
+            if key == 'logSeq':
+                yield "logSeq", value
+            elif key in ('each_time_habits', 'daily_habits'):
+                raise ValueError("Invalid habits data")
+        if stream.peek() == ",":
+            stream._consume(1)
+    stream.take("}")
+
+
+class FileLock:
+    """Advisory lock shared by every process (and thread) writing the same store.
+
+    Uses flock on POSIX and msvcrt.locking on Windows on a side file next to
+    the data. Reentrant within a process, so store methods holding it can call
+    each other.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+                else:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    while True:
+                        try:
+                            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            pass  # LK_LOCK gives up after ten seconds; keep waiting
+        except Exception:
+            self._thread_lock.release()
+            raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def close(self):
+        with self._thread_lock:
+            if self._fd is not None and self._depth == 0:
+                os.close(self._fd)
+                self._fd = None
+
+
+def file_state(path):
+    """(inode, size, mtime) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class EventLogStore:
+    """Habit storage made of a JSON snapshot plus an append-only event log.
+
+    Every change is appended to the log as one small JSON line, so a write costs
+    O(1) no matter how much history exists. Once the log grows past
+    ``compact_threshold`` events it is rotated and folded into a new snapshot
+    on a background thread. On startup the snapshot is read and the log tail
+    replayed on top of it; a line torn by a crash mid-write is ignored.
+
+    The snapshot is parsed one habit at a time. With ``lazy_history`` the
+    history of each habit is dropped while loading and re-read from the
+    habit's byte range on demand through ``load_history``. The snapshot stays
+    open so those ranges survive a compaction replacing the file; Windows
+    cannot replace an open file, so there histories are loaded eagerly.
+
+    Several processes may share the files. Every write happens under a
+    ``FileLock`` and first catches up with the log: events other processes
+    appended are queued for ``poll``, and sequence numbers are assigned at
+    write time so they stay contiguous across writers. A gap in the sequence
+    (another process folded events we never read, or replaced the snapshot)
+    makes ``poll`` ask for a full resync instead. Changes are spotted by
+    comparing the inode, size and mtime of the files, so an idle poll costs
+    three stat calls.
+    """
+
+    range_queries = False  # Date-range reads go through the in-memory CompletionIndex
+
+    def __init__(self, snapshot_path=HABITS_FILE, log_path=HABITS_LOG_FILE,
+                 compact_threshold=COMPACT_THRESHOLD, lazy_history=None):
+        self.lazy_history = os.name != "nt" if lazy_history is None else lazy_history
+        self._offsets = {}  # habit id -> (start, end) of its object in the open snapshot
+        self._snapshot_file = None
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.rotated_path = log_path + ".1"
+        self.compact_threshold = compact_threshold
+        self.seq = 0  # Highest sequence number written or read, across all processes
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(os.path.splitext(snapshot_path)[0] + ".lock")
+        self._log_file = None
+        self._log_inode = None  # Live log we have read up to _log_offset
+        self._log_offset = 0
+        self._log_tail = (0, None)  # (offset, seq) of the last line read there; inodes get reused
+        self._seen = None  # file_state of (log, rotated log, snapshot) after our last read or write
+        self._external = []  # Events from other processes not yet taken by poll
+        self._resync = False
+        self._compactor = None
+
+    def _read_snapshot(self, lazy=False):
+        """Stream the snapshot into {'each_time_habits', 'daily_habits'} plus its log sequence.
+
+        With lazy, histories are left out and the snapshot file is kept open
+        for load_history.
+        """
+        data = {'each_time_habits': [], 'daily_habits': []}
+        seq = 0
+        if not os.path.exists(self.snapshot_path):
+            return data, seq
+        f = open(self.snapshot_path, "rb")
+        try:
+            for item in iter_snapshot(f):
+                if item[0] == "logSeq":
+                    seq = item[1]
+                    continue
+                _, key, habit, start, end = item
+                if lazy and isinstance(habit, dict) and "id" in habit:
+                    habit.pop("history", None)
+                    habit.pop("completionDates", None)
+                    self._offsets[habit["id"]] = (start, end)
+                data[key].append(habit)
+        finally:
+            if lazy:
+                self._snapshot_file = f
+            else:
+                f.close()
+        return data, seq
+
+    def _snapshot_seq(self):
+        """The logSeq of the snapshot on disk, read from the end of the file."""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                f.seek(max(0, os.fstat(f.fileno()).st_size - 64))
+                tail = f.read()
+            _, found, rest = tail.rpartition(b'"logSeq":')
+            return int(rest.rstrip(b"}\r\n ")) if found else 0
+        except (OSError, ValueError):
+            return 0
+
+    def load_history(self, habit_id):
+        """Re-read one habit's CompletionIndex from its byte range in the loaded snapshot."""
+        span = self._offsets.pop(habit_id, None)
+        if span is None or self._snapshot_file is None:
+            return CompletionIndex()
+        with self._lock:
+            self._snapshot_file.seek(span[0])
+            raw = self._snapshot_file.read(span[1] - span[0])
+        return CompletionIndex.from_habit(json.loads(raw)) or CompletionIndex()
+
+    @staticmethod
+    def _read_log(path, offset=0):
+        """Parse the complete event lines after offset.
+
+        Only an unterminated last line is a torn write; reading stops before it
+        so the next append can cut it off. A complete line that does not parse
+        is reported and skipped, never treated as the end of the log, so the
+        events after it survive. Returns (events, offset after the last
+        complete line, offset where the last good line starts).
+        """
+        last = offset
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                raw = f.read()
+        except FileNotFoundError:
+            return [], offset, last
+        events = []
+        for line in raw.split(b"\n")[:-1]:
+            line += b"\n"  # Only newlines end a line; a corrupt one may hold a stray carriage return
+            try:
+                event = json.loads(line)
+                if not isinstance(event, dict):
+                    raise ValueError("not an event object")
+            except ValueError as e:
+                print(f"Error reading {path}: skipping corrupt line at byte {offset}: {e}")
+            else:
+                events.append(event)
+                last = offset
+            offset += len(line)
+        return events, offset, last  # Whatever follows the last newline is a torn write
+
+    def _same_log(self, path):
+        """Whether path still holds the lines we read up to _log_offset, not a new log on a reused inode."""
+        start, seq = self._log_tail
+        if self._log_offset == 0:
+            return True
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                return json.loads(f.read(self._log_offset - start)).get("seq") == seq
+        except (OSError, ValueError):
+            return False
+
+    def _replay(self, data, seq, events):
+        """Apply the events newer than seq to raw data; return the last sequence seen."""
+        index = {}
+        for key in ('each_time_habits', 'daily_habits'):
+            for h in data[key]:
+                if isinstance(h, dict) and "id" in h:
+                    index[h["id"]] = (h, key)
+        for event in events:
+            if event.get("seq", 0) <= seq:
+                continue
+            entry = index.get(event.get("id"))
+            if entry and "history" not in entry[0] and "completionDates" not in entry[0]:
+                entry[0]["history"] = self.load_history(entry[0]["id"])
+            apply_habit_event(data, index, event)
+            seq = event["seq"]
+        return seq
+
+    def _disk_state(self):
+        return file_state(self.log_path), file_state(self.rotated_path), file_state(self.snapshot_path)
+
+    def _catch_up(self):
+        """Read what other processes wrote since our last look (call with the file lock held).
+
+        New events are queued for poll; a sequence gap sets the resync flag.
+        """
+        live, rotated, snapshot = self._disk_state()
+        fresh = []
+        for path, info in ((self.rotated_path, rotated), (self.log_path, live)):
+            if info is None:
+                continue
+            known = info[0] == self._log_inode and self._same_log(path)
+            events, end, last = self._read_log(path, self._log_offset if known else 0)
+            fresh.extend(events)
+            if path == self.log_path:
+                if not known:
+                    self.pending = 0
+                    self._log_tail = (0, None)
+                if events:
+                    self._log_tail = (last, events[-1].get("seq"))
+                self._log_inode, self._log_offset = info[0], end
+                self.pending += len(events)
+        if live is None:
+            self._log_inode, self._log_offset, self._log_tail = None, 0, (0, None)
+        expected = self.seq + 1
+        external = []
+        for event in fresh:
+            seq = event.get("seq", 0)
+            if seq < expected:
+                continue
+            if seq > expected:
+                self._resync = True
+            external.append(event)
+            expected = seq + 1
+        if self._seen is None or snapshot != self._seen[2]:
+            snapshot_seq = self._snapshot_seq()
+            if snapshot_seq >= expected:
+                self._resync = True  # Folded or replaced by another process before we read the events
+                expected = snapshot_seq + 1
+        self.seq = expected - 1
+        with self._lock:
+            if self._resync:
+                self._external = []
+            else:
+                self._external.extend(external)
+        self._seen = self._disk_state()
+
+    def poll(self):
+        """Return (events other processes wrote since the last poll, whether a full resync is needed)."""
+        if self._disk_state() != self._seen:
+            with self._file_lock:
+                self._catch_up()
+        with self._lock:
+            events, self._external = self._external, []
+            resync, self._resync = self._resync, False
+        return events, resync
+
+    def load(self):
+        """Rebuild raw habits data from the snapshot plus the log tail."""
+        with self._file_lock:
+            if self._snapshot_file:
+                self._snapshot_file.close()
+                self._snapshot_file = None
+            self._offsets = {}
+            data, seq = self._read_snapshot(lazy=self.lazy_history)
+            rotated, _, _ = self._read_log(self.rotated_path)
+            live, end, last = self._read_log(self.log_path)
+            self.seq = self._replay(data, seq, rotated + live)
+            live_state = file_state(self.log_path)
+            self._log_inode, self._log_offset = (live_state[0], end) if live_state else (None, 0)
+            self._log_tail = (last, live[-1].get("seq")) if live else (0, None)
+            self.pending = len(live)
+            self._seen = self._disk_state()
+            with self._lock:
+                self._external, self._resync = [], False
+            if os.path.exists(self.rotated_path):
+                self.compact_async()  # A compaction did not finish; fold the rotated log now
+        return data
+
+    def encode(self, event):
+        """Return event as a log line; the sequence number is added when it is written."""
+        return json.dumps(event, separators=(",", ":"))
+
+    def write_lines(self, lines):
+        """Append encoded events with one write and one fsync; compact when the log grows too long."""
+        with self._file_lock:
+            self._catch_up()
+            live = file_state(self.log_path)
+            if live and live[0] == self._log_inode and live[1] > self._log_offset:
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(self._log_offset)  # Drop a torn line so ours do not join it
+            if self._log_file and (live is None or os.fstat(self._log_file.fileno()).st_ino != live[0]):
+                self._log_file.close()  # Rotated by another process since we opened it
+                self._log_file = None
+            if self._log_file is None:
+                self._log_file = open(self.log_path, "ab")
+            stamped = []
+            for line in lines:
+                self.seq += 1
+                stamped.append(('{"seq":%d,%s\n' % (self.seq, line[1:])).encode("utf-8"))
+            payload = b"".join(stamped)
+            self._log_file.write(payload)
+            instruments.count("bytes_written", len(payload))
+            self._log_file.flush()
+            os.fsync(self._log_file.fileno())
+            info = os.fstat(self._log_file.fileno())
+            if info.st_ino != self._log_inode:
+                self.pending = 0
+            self._log_inode, self._log_offset = info.st_ino, info.st_size
+            self._log_tail = (info.st_size - len(stamped[-1]), self.seq)
+            self.pending += len(lines)
+            self._seen = self._disk_state()
+            needs_compaction = self.pending >= self.compact_threshold
+        if needs_compaction:
+            self.compact_async()
+
+    def append(self, event):
+        """Append one event to the log synchronously."""
+        self.write_lines([self.encode(event)])
+
+    def compact_async(self):
+        """Rotate the live log and fold it into the snapshot on a background thread."""
+        with self._file_lock:
+            if self._compactor and self._compactor.is_alive():
+                return
+            if not os.path.exists(self.rotated_path):
+                self._catch_up()  # The rotated log must only hold events we have read
+                if self._log_file:
+                    self._log_file.close()
+                    self._log_file = None
+                if os.path.exists(self.log_path):
+                    os.replace(self.log_path, self.rotated_path)
+                self.pending = 0
+                self._seen = self._disk_state()
+            self._compactor = threading.Thread(target=self._compact_rotated, daemon=True)
+            self._compactor.start()
+
+    def _compact_rotated(self):
+        """Fold the rotated log into a new snapshot (runs on the compactor thread).
+
+        The fold runs without the file lock; the new snapshot is only swapped in
+        if no other process changed the snapshot or rotated log meanwhile.
+        """
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            before = file_state(self.snapshot_path), file_state(self.rotated_path)
+            if before[1] is None:
+                return
+            data, seq = self._read_snapshot()
+            events, _, _ = self._read_log(self.rotated_path)
+            seq = self._replay(data, seq, events)
+            self._write_snapshot_file(self._snapshot_payload(data, seq), tmp_path)
+            with self._file_lock:
+                if (file_state(self.snapshot_path), file_state(self.rotated_path)) == before:
+                    os.replace(tmp_path, self.snapshot_path)
+                    os.remove(self.rotated_path)
+        except Exception as e:
+            print(f"Error compacting habits log: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _snapshot_payload(self, data, seq):
+        for key in ('each_time_habits', 'daily_habits'):
+            for habit in data[key]:
+                if isinstance(habit, dict) and "completionDates" in habit:
+                    raw_history(habit)  # Files from older versions are rewritten in the encoded format
+        payload = {
+            'each_time_habits': data['each_time_habits'],
+            'daily_habits': data['daily_habits'],
+            'logSeq': seq
+        }
+        return json.dumps(payload, separators=(",", ":"), default=encode_json_value)
+
+    def _write_snapshot_file(self, text, tmp_path=None):
+        """Write text to a temp file and fsync it; replace the snapshot with it unless tmp_path is given."""
+        replace = tmp_path is None
+        tmp_path = tmp_path or self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        instruments.count("bytes_written", len(text))
+        if replace:
+            os.replace(tmp_path, self.snapshot_path)
+
+    def encode_snapshot(self, data):
+        """Serialize data as a snapshot; its sequence number is added when it is written."""
+        return self._snapshot_payload(data, 0)
+
+    def write_snapshot_text(self, text):
+        """Replace the store with an encoded snapshot and discard the log it supersedes.
+
+        The snapshot takes a sequence number of its own, so other processes see
+        the gap and resync to it.
+        """
+        if self._compactor:
+            self._compactor.join()
+        with self._file_lock:
+            self._catch_up()
+            self.seq += 1
+            head, _, _ = text.rpartition('"logSeq":')
+            self._write_snapshot_file(f'{head}"logSeq":{self.seq}}}')
+            if self._log_file:
+                self._log_file.close()
+                self._log_file = None
+            for path in (self.log_path, self.rotated_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_inode, self._log_offset = None, 0
+            self.pending = 0
+            self._seen = self._disk_state()
+
+    def write_snapshot(self, data):
+        """Write data as a full snapshot synchronously."""
+        self.write_snapshot_text(self.encode_snapshot(data))
+
+    def close(self):
+        """Wait for any running compaction and close the log, snapshot and lock files."""
+        if self._compactor:
+            self._compactor.join()
+        with self._file_lock:
+            if self._log_file:
+                self._log_file.close()
+                self._log_file = None
+        with self._lock:
+            if self._snapshot_file:
+                self._snapshot_file.close()
+                self._snapshot_file = None
+        self._file_lock.close()
+
+
+class HabitRegistry:
+    """Habits of both modes keyed by uid, in insertion order.
+
+    Lookup, delete and mode resolution are O(1) dict operations. The per-mode
+    lists the UI iterates are cached and only rebuilt after a change; callers
+    must treat them as read-only.
+    """
+
+    MODES = ('each_time', 'same_day')
+
+    def __init__(self, each_time=(), daily=()):
+        self._modes = {}  # uid -> mode
+        self._habits = {mode: {} for mode in self.MODES}  # mode -> {uid: habit}, insertion ordered
+        self._lists = {}  # mode -> cached list of that mode's habits
+        for habit in each_time:
+            self.add(habit, 'each_time')
+        for habit in daily:
+            self.add(habit, 'same_day')
+
+    def add(self, habit, mode):
+        self.remove(habit.uid)
+        self._modes[habit.uid] = mode
+        self._habits[mode][habit.uid] = habit
+        self._lists.pop(mode, None)
+
+    def remove(self, uid):
+        """Remove a habit and return (habit, mode), or (None, None) if it is unknown."""
+        mode = self._modes.pop(uid, None)
+        if mode is None:
+            return None, None
+        self._lists.pop(mode, None)
+        return self._habits[mode].pop(uid), mode
+
+    def get(self, uid):
+        """Return (habit, mode), or (None, None) if it is unknown."""
+        mode = self._modes.get(uid)
+        if mode is None:
+            return None, None
+        return self._habits[mode][uid], mode
+
+    def mode_of(self, habit):
+        return self._modes.get(habit.uid)
+
+    def count(self, mode):
+        return len(self._habits[mode])
+
+    def habits(self, mode):
+        """The habits of one mode in insertion order (a shared, read-only list)."""
+        habits = self._lists.get(mode)
+        if habits is None:
+            habits = self._lists[mode] = list(self._habits[mode].values())
+        return habits
+
+    def __len__(self):
+        return len(self._modes)
+
+
+class SqliteStore:
+    """Habit storage in SQLite with an indexed completions table.
+
+    Habits are loaded without their history; completion dates are fetched per
+    habit or per date range through the (habit_id, date) index when a view needs
+    them. Writes use the same encoded events as EventLogStore and are applied in
+    one transaction per batch. The database runs in WAL mode so reads are not
+    blocked by the save worker. An empty database is filled once from
+    habits.json (list or dict format) and habits.log if they exist.
+
+    SQLite serializes writers from several processes itself, and every event
+    is applied relative to the stored row, so concurrent writers do not lose
+    completions. ``poll`` notices commits from other connections through
+    ``PRAGMA data_version`` and asks for a resync of the habit rows.
+    """
+
+    lazy_history = True
+    range_queries = True
+
+    def __init__(self, path=HABITS_DB_FILE, legacy_snapshot=HABITS_FILE, legacy_log=HABITS_LOG_FILE):
+        self.path = path
+        self.legacy_snapshot = legacy_snapshot
+        self.legacy_log = legacy_log
+        self.seq = 0
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS habits (
+                id TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                last_completed TEXT,
+                completion_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS completions (habit_id TEXT NOT NULL, date TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_habits_mode ON habits (mode, position);
+            CREATE INDEX IF NOT EXISTS idx_completions_habit_date ON completions (habit_id, date);
+        """)
+
+    def load(self):
+        """Return every habit (without its history), migrating habits.json on first use."""
+        with FileLock(self.path + ".lock") as migration_lock:
+            with self._lock:
+                migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+            if migrated is None:
+                if os.path.exists(self.legacy_snapshot) or os.path.exists(self.legacy_log):
+                    legacy = EventLogStore(self.legacy_snapshot, self.legacy_log, lazy_history=False)
+                    self.write_snapshot(legacy.load())
+                    legacy.close()
+                with self._lock, self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', ?)", (self.legacy_snapshot,))
+        migration_lock.close()
+        data = {'each_time_habits': [], 'daily_habits': []}
+        with self._lock:
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT id, mode, text, completed, last_completed, completion_count "
+                "FROM habits ORDER BY mode, position"
+            ).fetchall()
+        for habit_id, mode, text, completed, last_completed, count in rows:
+            data[f"{mode}_habits"].append({
+                "id": habit_id,
+                "text": text,
+                "completed": bool(completed),
+                "lastCompleted": last_completed,
+                "completionCount": count
+            })
+        return data
+
+    def load_history(self, habit_id):
+        """CompletionIndex of one habit's whole history."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, COUNT(*) FROM completions WHERE habit_id = ? GROUP BY date", (habit_id,)
+            ).fetchall()
+        return CompletionIndex.from_counts({iso_to_ordinal(day): count for day, count in rows})
+
+    def poll(self):
+        """Return (events, whether another connection committed since the last load or poll)."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = self._data_version is not None and version != self._data_version
+        self._data_version = version
+        return [], changed
+
+    def completion_counts(self, habit_id, start, end):
+        """{date ordinal: completions} for one habit between two dates, as an indexed range query."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, COUNT(*) FROM completions WHERE habit_id = ? AND date BETWEEN ? AND ? "
+                "GROUP BY date", (habit_id, start.isoformat(), end.isoformat())
+            ).fetchall()
+        return {date.fromisoformat(day).toordinal(): count for day, count in rows}
+
+    def encode(self, event):
+        with self._lock:
+            self.seq += 1
+            return json.dumps(dict(event, seq=self.seq), separators=(",", ":"))
+
+    def write_lines(self, lines):
+        """Apply a batch of encoded events in a single transaction."""
+        with self._lock, self._conn:
+            for line in lines:
+                self._apply(json.loads(line))
+        instruments.count("bytes_written", sum(len(line) for line in lines))
+
+    def append(self, event):
+        self.write_lines([self.encode(event)])
+
+    def _apply(self, event):
+        conn = self._conn
+        op = event.get("op")
+        if op == "add":
+            habit = event["habit"]
+            mode = 'each_time' if event.get("mode") == 'each_time' else 'daily'
+            self._insert_habit(habit, mode, conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM habits WHERE mode = ?", (mode,)
+            ).fetchone()[0])
+            return
+        row = conn.execute("SELECT mode FROM habits WHERE id = ?", (event.get("id"),)).fetchone()
+        if row is None:
+            return
+        habit_id, mode = event["id"], row[0]
+        if op == "delete":
+            conn.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+            conn.execute("DELETE FROM completions WHERE habit_id = ?", (habit_id,))
+            return
+        if op in ("complete", "import"):
+            for day in (event["dates"] if op == "import" else [event["date"]]):
+                if mode == 'daily':
+                    conn.execute(
+                        "UPDATE habits SET completed = 1, last_completed = ? "
+                        "WHERE id = ? AND (last_completed IS NULL OR last_completed <= ?)", (day, habit_id, day)
+                    )
+                    if conn.execute(
+                        "SELECT 1 FROM completions WHERE habit_id = ? AND date = ? LIMIT 1", (habit_id, day)
+                    ).fetchone():
+                        continue
+                conn.execute("INSERT INTO completions VALUES (?, ?)", (habit_id, day))
+                conn.execute(
+                    "UPDATE habits SET completion_count = completion_count + 1 WHERE id = ?", (habit_id,)
+                )
+        elif op == "uncomplete":
+            day = event["date"]
+            done = conn.execute(
+                "SELECT rowid FROM completions WHERE habit_id = ? AND date = ? LIMIT 1", (habit_id, day)
+            ).fetchone()
+            conn.execute("UPDATE habits SET completed = 0, last_completed = NULL WHERE id = ?", (habit_id,))
+            if done is not None:
+                conn.execute("DELETE FROM completions WHERE rowid = ?", (done[0],))
+                conn.execute(
+                    "UPDATE habits SET completion_count = completion_count - 1 WHERE id = ?", (habit_id,)
+                )
+
+    def _insert_habit(self, habit, mode, position):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO habits VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (habit["id"], mode, position, habit["text"], int(bool(habit.get("completed"))),
+             habit.get("lastCompleted"), habit.get("completionCount", 0))
+        )
+        history = raw_history(habit)
+        self._conn.executemany(
+            "INSERT INTO completions VALUES (?, ?)",
+            ((habit["id"], ordinal_to_iso(ordinal))
+             for ordinal, count in zip(history.ordinals, history.counts) for _ in range(count))
+        )
+
+    def encode_snapshot(self, data):
+        return json.dumps(data, separators=(",", ":"), default=encode_json_value)
+
+    def write_snapshot_text(self, text):
+        """Replace every habit and completion with the snapshot, in one transaction."""
+        instruments.count("bytes_written", len(text))
+        data = json.loads(text)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM habits")
+            self._conn.execute("DELETE FROM completions")
+            for key, mode in (('each_time_habits', 'each_time'), ('daily_habits', 'daily')):
+                for position, habit in enumerate(data.get(key, [])):
+                    if isinstance(habit, dict) and "id" in habit and "text" in habit:
+                        self._insert_habit(habit, mode, position)
+
+    def write_snapshot(self, data):
+        self.write_snapshot_text(self.encode_snapshot(data))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def user_dir(data_dir, user=None):
+    """Directory of one user's shard; the default user keeps its files in data_dir itself."""
+    if user is None:
+        return data_dir
+    if not user or user.startswith(".") or not all(c.isalnum() or c in "-_." for c in user):
+        raise ValueError(f"Invalid user name {user!r}: use letters, digits, '-', '_' and '.'")
+    return os.path.join(data_dir, USERS_DIR, user)
+
+
+def list_users(data_dir):
+    """Sorted names of the users with a shard under data_dir."""
+    try:
+        entries = os.scandir(os.path.join(data_dir, USERS_DIR))
+    except FileNotFoundError:
+        return []
+    with entries:
+        return sorted(e.name for e in entries if e.is_dir() and not e.name.startswith("."))
+
+
+def open_store(kind, directory=".", lazy_history=None):
+    """Create the storage backend selected with --storage over the shard in directory.
+
+    Each shard is self-contained (its own snapshot, log and lock, or its own
+    database), so opening one never touches the files of another.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshot = os.path.join(directory, HABITS_FILE)
+    log = os.path.join(directory, HABITS_LOG_FILE)
+    if kind == "sqlite":
+        return SqliteStore(os.path.join(directory, HABITS_DB_FILE), snapshot, log)
+    return EventLogStore(snapshot, log, lazy_history=lazy_history)
+
+
+def summarize_users(users, data_dir, storage, start, end):
+    """Completion totals of each user's shard over the ordinals [start, end]; runs in a worker.
+
+    Shards are opened one at a time with histories loaded eagerly, since
+    every habit is read once. A shard that fails to load is reported and
+    left out.
+    """
+    summaries = []
+    for user in users:
+        try:
+            store = open_store(storage, user_dir(data_dir, user), lazy_history=False)
+        except Exception as e:
+            print(f"Error opening habits of {user}: {e}")
+            continue
+        try:
+            data = store.load()
+            habits = {}  # habit text -> days done in the window
+            completions = streak = 0  # streak: the user's longest streak still running on end
+            for raw in data['each_time_habits'] + data['daily_habits']:
+                index = CompletionIndex.from_habit(raw) or store.load_history(raw["id"])
+                habits[raw["text"]] = habits.get(raw["text"], 0) + len(index.days_between(start, end))
+                completions += index.count_between(start, end)
+                streak = max(streak, index.current_streak(end))
+            summaries.append({
+                "user": user,
+                "habits": len(data['each_time_habits']) + len(data['daily_habits']),
+                "completions": completions,
+                "days_done": sum(habits.values()),
+                "current_streak": streak,
+                "habit_days": habits
+            })
+        except Exception as e:
+            print(f"Error loading habits of {user}: {e}")
+        finally:
+            store.close()
+    return summaries
+
+
+def aggregate_users(data_dir, storage, users=None, days=30, end=None, jobs=None, top=10):
+    """Team stats across user shards: completion rates, a leaderboard and habits users share.
+
+    A user's completion rate is the share of (habit, day) pairs in the last
+    ``days`` days with at least one completion. Shards are summarized in
+    batches by a pool of ``jobs`` processes (one per core by default) and
+    only the small per-user summaries travel back to be merged.
+    """
+    users = list_users(data_dir) if users is None else users
+    end = end or date.today()
+    end_ordinal = end.toordinal()
+    start_ordinal = end_ordinal - days + 1
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(users) or 1))
+    summaries = map_in_batches(summarize_users, users, jobs, data_dir, storage, start_ordinal, end_ordinal)
+
+    shared = {}  # habit text -> [users with it, days done]
+    for summary in summaries:
+        summary["completion_rate"] = summary["days_done"] / (summary["habits"] * days) if summary["habits"] else 0.0
+        for text, done in summary.pop("habit_days").items():
+            entry = shared.setdefault(text, [0, 0])
+            entry[0] += 1
+            entry[1] += done
+    habits = sum(s["habits"] for s in summaries)
+    leaderboard = sorted(summaries, key=lambda s: (-s["completion_rate"], -s["completions"], s["user"]))
+    shared_habits = sorted(
+        ({"habit": text, "users": count, "completion_rate": done / (count * days)}
+         for text, (count, done) in shared.items() if count > 1),
+        key=lambda h: (-h["users"], -h["completion_rate"], h["habit"])
+    )
+    return {
+        "start": ordinal_to_iso(start_ordinal),
+        "end": ordinal_to_iso(end_ordinal),
+        "users": len(summaries),
+        "habits": habits,
+        "completions": sum(s["completions"] for s in summaries),
+        "completion_rate": sum(s["days_done"] for s in summaries) / (habits * days) if habits else 0.0,
+        "leaderboard": leaderboard[:top],
+        "shared_habits": shared_habits[:top]
+    }
+
+
+class SaveWorker:
+    """Writer thread that coalesces bursts of changes into one disk write.
+
+    Changes are encoded on the caller's thread (so later edits cannot leak into
+    them) and queued. The worker waits ``debounce`` seconds after the first
+    queued change, then writes everything that arrived with a single append and
+    fsync. A queued snapshot supersedes every change queued before it.
+    """
+
+    def __init__(self, store, debounce=SAVE_DEBOUNCE_SECONDS):
+        self.store = store
+        self.debounce = debounce
+        self.disk_writes = 0
+        self._queue = []  # ("line", text) or ("snapshot", text)
+        self._cond = threading.Condition()
+        self._writing = False
+        self._flushing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="habit-save-worker", daemon=True)
+        self._thread.start()
+
+    def submit_event(self, event):
+        """Queue one change; returns immediately."""
+        line = self.store.encode(event)
+        with self._cond:
+            self._queue.append(("line", line))
+            self._cond.notify_all()
+
+    def submit_snapshot(self, data):
+        """Queue a full snapshot of data, replacing any changes still waiting."""
+        text = self.store.encode_snapshot(data)
+        with self._cond:
+            self._queue = [("snapshot", text)]
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.debounce
+                while not (self._closed or self._flushing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._queue = self._queue, []
+                self._writing = True
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Error saving habits: {e}")
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    @instruments.timed('save')
+    def _write(self, batch):
+        lines = []
+        for kind, text in batch:
+            if kind == "snapshot":
+                self.store.write_snapshot_text(text)
+                self.disk_writes += 1
+                instruments.count("disk_writes")
+                lines = []
+            else:
+                lines.append(text)
+        if lines:
+            self.store.write_lines(lines)
+            self.disk_writes += 1
+            instruments.count("disk_writes")
+
+    def flush(self):
+        """Write everything queued now and wait until it is on disk."""
+        with self._cond:
+            if not self._thread.is_alive():
+                return
+            self._flushing = True
+            self._cond.notify_all()
+            while self._queue or self._writing:
+                self._cond.wait()
+            self._flushing = False
+
+    def close(self):
+        """Flush pending changes and stop the worker thread; safe to call twice."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class VirtualHabitList:
+    """Recycled pool of habit rows drawn straight onto the main canvas.
+
+    Only the rows in the viewport plus ``overscan`` rows either side have
+    widgets. Scrolling re-binds pooled rows to other habits instead of
+    creating new ones, so the widget count stays constant however long the
+    list is.
+    """
+
+    def __init__(self, app, canvas, row_height=VIRTUAL_ROW_HEIGHT, overscan=VIRTUAL_OVERSCAN):
+        self.app = app
+        self.canvas = canvas
+        self.row_height = row_height
+        self.overscan = overscan
+        self.habits = []
+        self.mode = None
+        self.pool = []  # (row widgets, canvas window item)
+        self.active = False
+
+    def show(self, habits, mode):
+        """Display habits of the given mode using the pooled rows."""
+        self.habits = habits
+        self.mode = mode
+        self.active = True
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), len(habits) * self.row_height))
+        self.refresh()
+
+    def hide(self):
+        """Hide every pooled row; the pool is kept for the next time the list is shown."""
+        self.active = False
+        for _, item in self.pool:
+            self.canvas.itemconfigure(item, state="hidden")
+
+    @instruments.timed('render_virtual')
+    def refresh(self):
+        """Bind the pooled rows to the habits currently in (or near) the viewport."""
+        if not self.active:
+            return
+        top = int(self.canvas.canvasy(0))
+        first = max(0, top // self.row_height - self.overscan)
+        needed = max(self.canvas.winfo_height(), self.row_height) // self.row_height + 1 + 2 * self.overscan
+        width = self.canvas.winfo_width()
+        for slot in range(needed):
+            position = first + slot
+            if position >= len(self.habits):
+                needed = slot
+                break
+            habit = self.habits[position]
+            if slot == len(self.pool):
+                row = self.app.create_habit_row(self.canvas, habit, self.mode)
+                item = self.canvas.create_window(0, 0, window=row["frame"], anchor="nw")
+                self.pool.append((row, item))
+            row, item = self.pool[slot]
+            row["habit_id"] = habit.uid
+            self.app.refresh_habit_row(row, habit, self.mode)
+            self.canvas.coords(item, 0, position * self.row_height)
+            self.canvas.itemconfigure(item, state="normal", width=width, height=self.row_height - 4)
+        for _, item in self.pool[needed:]:
+            self.canvas.itemconfigure(item, state="hidden")
+
+
+class WeeklyBarChart:
+    """Persistent Each Time bar chart that is updated in place instead of rebuilt.
+
+    Bars and title are animated artists: switching habits only changes bar
+    heights and the title text, restores the cached background and blits.
+    A full draw (with tight_layout) happens only when the tick labels change.
+    """
+
+    def __init__(self, parent_frame, figure_module, backend):
+        self.figure = figure_module.Figure(figsize=(4, 2.5))
+        self.ax = self.figure.add_subplot()
+        self.bars = self.ax.bar(range(7), [0] * 7, animated=True)
+        self.title = self.ax.set_title("", fontsize=10, animated=True)
+        self.ax.set_xlabel("Date", fontsize=8)
+        self.ax.set_ylabel("Completions", fontsize=8)
+        self.ax.tick_params(axis='y', labelsize=8)
+        self.canvas = backend.FigureCanvasTkAgg(self.figure, master=parent_frame)
+        self.canvas.get_tk_widget().pack(fill="x", pady=5)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.background = None
+        self.axes_key = None
+
+    def on_draw(self, event):
+        """Cache the static background after a full draw, then paint the animated artists."""
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_animated()
+        self.canvas.blit(self.figure.bbox)
+
+    def draw_animated(self):
+        for bar in self.bars:
+            self.ax.draw_artist(bar)
+        self.ax.draw_artist(self.title)
+
+    def update(self, title, frequencies, date_labels, y_ticks, color):
+        """Show new bar heights and labels, redrawing the axes only if the ticks changed."""
+        for bar, frequency in zip(self.bars, frequencies):
+            bar.set_height(frequency)
+            bar.set_color(color)
+        self.title.set_text(title)
+
+        axes_key = (tuple(date_labels), tuple(y_ticks))
+        if axes_key != self.axes_key or self.background is None:
+            self.axes_key = axes_key
+            self.ax.set_xticks(range(len(date_labels)))
+            self.ax.set_xticklabels(date_labels, rotation=45, ha="right", fontsize=8)
+            self.ax.set_yticks(y_ticks)
+            self.ax.set_ylim(0, y_ticks[-1])
+            self.figure.tight_layout()
+            self.canvas.draw()  # on_draw refreshes the background and blits
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_animated()
+            self.canvas.blit(self.figure.bbox)
+
+
+def weekly_y_ticks(max_freq):
+    """Y axis ticks for a weekly bar chart whose tallest bar is max_freq."""
+    if max_freq == 0:
+        return [0, 1]
+    if max_freq <= 3:
+        return list(range(0, max_freq + 1, 1))
+    step = max(1, math.ceil(max_freq / 3))
+    return list(range(0, max_freq + step, step))
+
+
+def completion_levels(index, start_ordinal, days, step=1):
+    """Heat level (0-4) of each of `days` days from start_ordinal; step scales a single completion."""
+    levels = bytearray(days)
+    top = len(HEATMAP_COLORS) - 1
+    for ordinal, count in index.runs_between(start_ordinal, start_ordinal + days - 1):
+        levels[ordinal - start_ordinal] = min(count * step, top)
+    return levels
+
+
+def year_heatmap_image(level_rows, today_ordinal, start_ordinal, cell, widgets=tk):
+    """Render GitHub-style year strips (weeks across, weekdays down) as one PhotoImage.
+
+    Every habit gets seven pixel rows plus a blank separator. The whole image is
+    written with a single put() at one pixel per day and then zoomed to the cell size.
+    ``widgets`` supplies PhotoImage (the tkinter module by default).
+    """
+    blank = "#F3F4F6"
+    rows = []
+    for levels in level_rows:
+        for weekday in range(7):
+            pixels = []
+            for week in range(HEATMAP_WEEKS):
+                offset = week * 7 + weekday
+                if start_ordinal + offset > today_ordinal:
+                    pixels.append(blank)
+                else:
+                    pixels.append(HEATMAP_COLORS[levels[offset]])
+            rows.append("{" + " ".join(pixels) + "}")
+        rows.append("{" + " ".join([blank] * HEATMAP_WEEKS) + "}")
+    image = widgets.PhotoImage(width=HEATMAP_WEEKS, height=max(len(rows), 1))
+    if rows:
+        image.put(" ".join(rows), to=(0, 0))
+    return image.zoom(cell)
+
+
+def heatmap_start(today):
+    """Monday that starts the HEATMAP_WEEKS-week window ending with today's week."""
+    return today - timedelta(days=today.weekday() + 7 * (HEATMAP_WEEKS - 1))
+
+
+def compute_analytics(np, habits, indexes, today_ordinal, rolling_days=30):
+    """Streaks, completion rates, rolling averages and weekday mix for all habits in one pass.
+
+    The last year of every habit's completions becomes one column of a
+    (365 x habits) count matrix, and rates, rolling averages and weekdays
+    are whole-matrix NumPy operations on it. Streaks can reach further back,
+    so they come from each index's sorted day ordinals instead: one np.diff
+    per habit splits them into runs of consecutive days. Returns
+    {habit id: stats dict}.
+    """
+    if not habits:
+        return {}
+    days = 365
+    start = today_ordinal - days + 1
+
+    rows, cols, counts = [], [], []
+    current = np.zeros(len(habits), dtype=np.int64)
+    longest = np.zeros(len(habits), dtype=np.int64)
+    for col, index in enumerate(indexes):
+        ordinals = np.frombuffer(index.ordinals, dtype=np.intc)
+        hi = int(np.searchsorted(ordinals, today_ordinal, side="right"))
+        lo = int(np.searchsorted(ordinals, start))
+        rows.append(ordinals[lo:hi] - start)
+        cols.append(np.full(hi - lo, col))
+        counts.append(np.frombuffer(index.counts, dtype=np.uintc)[lo:hi])
+        if hi:
+            # Run boundaries are where consecutive completed days are more than one day apart
+            ends = np.append(np.flatnonzero(np.diff(ordinals[:hi]) != 1), hi - 1)
+            runs = np.diff(ends, prepend=-1)
+            longest[col] = runs.max()
+            # A streak is still alive until today ends, so an open today falls back to yesterday
+            if ordinals[hi - 1] >= today_ordinal - 1:
+                current[col] = runs[-1]
+    matrix = np.zeros((days, len(habits)), dtype=np.int32)
+    # (day, habit) pairs are unique because each index holds one count per day
+    matrix[np.concatenate(rows), np.concatenate(cols)] = np.concatenate(counts)
+    done = matrix > 0
+
+    rates = {window: done[-window:].mean(axis=0) for window in (7, 30, 365)}
+    tail = matrix[-(rolling_days + 6):]
+    cumulative = np.zeros((len(tail) + 1, len(habits)), dtype=np.int64)
+    np.cumsum(tail, axis=0, out=cumulative[1:])
+    rolling = (cumulative[7:] - cumulative[:-7]) / 7.0
+    weekday_of_row = (np.arange(days) + date.fromordinal(start).weekday()) % 7
+    weekdays = np.stack([matrix[weekday_of_row == w].sum(axis=0) for w in range(7)])
+
+    return {
+        habit.uid: {
+            "current_streak": int(current[i]),
+            "longest_streak": int(longest[i]),
+            "rate_7": float(rates[7][i]),
+            "rate_30": float(rates[30][i]),
+            "rate_365": float(rates[365][i]),
+            "avg_7": float(rolling[-1, i]),
+            "rolling_7": [round(float(v), 2) for v in rolling[:, i]],
+            "weekdays": [int(v) for v in weekdays[:, i]]
+        }
+        for i, habit in enumerate(habits)
+    }
+
+
+def describe_stats(stats):
+    """One-line summary of a habit's analytics for the stats window and console."""
+    best_day = calendar.day_abbr[stats["weekdays"].index(max(stats["weekdays"]))]
+    return (
+        f"Streak {stats['current_streak']} (best {stats['longest_streak']}) | "
+        f"7d {stats['rate_7']:.0%} 30d {stats['rate_30']:.0%} 365d {stats['rate_365']:.0%} | "
+        f"7d avg {stats['avg_7']:.1f}/day | Best day {best_day}"
+    )
+
+
+class CalendarView:
+    """Completion calendar for one habit drawn on a single Canvas.
+
+    Month and multi-month spans draw each day as canvas primitives; the year span
+    is a GitHub-style heatmap rendered as one image. Showing another habit just
+    clears and redraws the canvas. ``widgets`` supplies Frame, Button, Canvas and
+    PhotoImage (the tkinter module by default).
+    """
+
+    SPANS = (("Month", 1), ("3 Months", 3), ("Year", 12))
+    CELL_WIDTH = 48
+    CELL_HEIGHT = 26
+    TITLE_HEIGHT = 20
+    HEATMAP_CELL = 6
+
+    def __init__(self, parent_frame, widgets=tk):
+        self.widgets = widgets
+        controls = widgets.Frame(parent_frame, bg="#F3F4F6")
+        controls.pack(anchor="w")
+        for text, months in self.SPANS:
+            widgets.Button(
+                controls, text=text, command=lambda m=months: self.set_span(m),
+                font=("Arial", 8)
+            ).pack(side="left", padx=2)
+        self.canvas = widgets.Canvas(parent_frame, bg="#F3F4F6", highlightthickness=0, height=1)
+        self.canvas.pack(fill="x", pady=5)
+        self.months = 1
+        self.habit_text = ""
+        self.index = None
+        self.color = "#4B5EAA"
+        self.step = 4
+        self.image = None  # Tk drops images without a Python reference
+
+    def show(self, habit_text, index, color, step=4):
+        """Draw the calendar for another habit."""
+        self.habit_text = habit_text
+        self.index = index
+        self.color = color
+        self.step = step
+        self.draw()
+
+    def set_span(self, months):
+        self.months = months
+        self.draw()
+
+    def draw(self):
+        self.canvas.delete("all")
+        if self.index is None:
+            return
+        today = datetime.now().date()
+        if self.months == 12:
+            height = self.draw_year(today)
+        else:
+            height = 0
+            year, month = today.year, today.month - self.months + 1
+            while month < 1:
+                year, month = year - 1, month + 12
+            for _ in range(self.months):
+                height = self.draw_month(height, year, month, today)
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        self.canvas.configure(height=height)
+
+    def draw_month(self, y, year, month, today):
+        """Draw one month grid (7 days per row) at y and return the y below it."""
+        _, num_days = calendar.monthrange(year, month)
+        self.canvas.create_text(
+            0, y, text=f"{calendar.month_name[month]} {year}", anchor="nw",
+            font=("Arial", 10, "bold"), fill=self.color
+        )
+        y += self.TITLE_HEIGHT
+        first = date(year, month, 1).toordinal()
+        today_ordinal = today.toordinal()
+        for day in range(1, num_days + 1):
+            col = (day - 1) % 7
+            row = (day - 1) // 7
+            x0 = col * (self.CELL_WIDTH + 2)
+            y0 = y + row * (self.CELL_HEIGHT + 2)
+            ordinal = first + day - 1
+            if ordinal in self.index:
+                fill, text_color = "#10B981", "white"  # Completed
+            elif ordinal < today_ordinal:
+                fill, text_color = "#FCA5A5", "black"  # Missed
+            else:
+                fill, text_color = "white", "black"  # Still to come
+            self.canvas.create_rectangle(
+                x0, y0, x0 + self.CELL_WIDTH, y0 + self.CELL_HEIGHT, fill=fill, outline="#D1D5DB"
+            )
+            self.canvas.create_text(
+                x0 + self.CELL_WIDTH // 2, y0 + self.CELL_HEIGHT // 2, text=str(day),
+                font=("Arial", 8), fill=text_color
+            )
+        rows = (num_days + 6) // 7
+        return y + rows * (self.CELL_HEIGHT + 2) + 6
+
+    def draw_year(self, today):
+        """Draw the year heatmap for the habit and return its height."""
+        start = heatmap_start(today)
+        levels = completion_levels(self.index, start.toordinal(), HEATMAP_WEEKS * 7, self.step)
+        self.canvas.create_text(
+            0, 0, text=f"{self.habit_text} - last {HEATMAP_WEEKS} weeks", anchor="nw",
+            font=("Arial", 10, "bold"), fill=self.color
+        )
+        self.image = year_heatmap_image([levels], today.toordinal(), start.toordinal(), self.HEATMAP_CELL,
+                                        self.widgets)
+        self.canvas.create_image(0, self.TITLE_HEIGHT, image=self.image, anchor="nw")
+        return self.TITLE_HEIGHT + self.image.height()
+
+
+class ReportRenderer:
+    """Draws the weekly bar chart and month calendar of one habit at a time into a reused Agg figure.
+
+    Every artist (bars, day cells, day numbers, titles) is created once; a
+    habit only changes heights, colors and text before the figure is saved.
+    One renderer lives in each report worker process.
+    """
+
+    def __init__(self, fmt, out_dir, week_labels, report_day):
+        figure_module = lazy_import("matplotlib.figure")
+        agg = lazy_import("matplotlib.backends.backend_agg")
+        self.fmt = fmt
+        self.out_dir = out_dir
+        self.figure = figure_module.Figure(figsize=(8, 3.2))
+        agg.FigureCanvasAgg(self.figure)
+        self.bar_ax, self.cal_ax = self.figure.subplots(1, 2, gridspec_kw={"width_ratios": [1.1, 1]})
+        self.bars = self.bar_ax.bar(range(7), [0] * 7)
+        self.bar_ax.set_xticks(range(7))
+        self.bar_ax.set_xticklabels(week_labels, rotation=45, ha="right", fontsize=8)
+        self.bar_ax.set_xlabel("Date", fontsize=8)
+        self.bar_ax.set_ylabel("Completions", fontsize=8)
+        self.bar_ax.tick_params(axis='y', labelsize=8)
+        self.title = self.figure.suptitle("", fontsize=11)
+
+        patches = lazy_import("matplotlib.patches")
+        year, month = report_day.year, report_day.month
+        _, num_days = calendar.monthrange(year, month)
+        self.first_ordinal = date(year, month, 1).toordinal()
+        self.today_ordinal = report_day.toordinal()
+        self.cal_ax.set_xlim(0, 7)
+        self.cal_ax.set_ylim((num_days + 6) // 7, 0)
+        self.cal_ax.set_axis_off()
+        self.cal_ax.set_title(f"{calendar.month_name[month]} {year}", fontsize=10)
+        self.cells = []
+        self.numbers = []
+        for day in range(num_days):
+            col, row = day % 7, day // 7
+            cell = patches.Rectangle((col + 0.04, row + 0.04), 0.92, 0.92, edgecolor="#D1D5DB", linewidth=0.8)
+            self.cal_ax.add_patch(cell)
+            self.cells.append(cell)
+            self.numbers.append(self.cal_ax.text(col + 0.5, row + 0.5, str(day + 1), ha="center", va="center", fontsize=7))
+        self.figure.tight_layout()
+        self.figure.set_layout_engine("none")  # Keep the positions; a layout engine costs an extra draw per save
+
+    def draw(self, title, color, frequencies, month_counts):
+        """Point the reused artists at another habit."""
+        self.title.set_text(title)
+        for bar, frequency in zip(self.bars, frequencies):
+            bar.set_height(frequency)
+            bar.set_color(color)
+        y_ticks = weekly_y_ticks(max(frequencies, default=0))
+        self.bar_ax.set_yticks(y_ticks)
+        self.bar_ax.set_ylim(0, y_ticks[-1])
+        for day, (cell, number, count) in enumerate(zip(self.cells, self.numbers, month_counts)):
+            if count:
+                fill, text_color = "#10B981", "white"  # Completed
+            elif self.first_ordinal + day < self.today_ordinal:
+                fill, text_color = "#FCA5A5", "black"  # Missed
+            else:
+                fill, text_color = "white", "black"  # Still to come
+            cell.set_facecolor(fill)
+            number.set_color(text_color)
+
+    def render(self, habit, pdf=None):
+        """Draw one habit payload and save it as its own file, or as the next page of pdf."""
+        stem, title, color, frequencies, month_counts = habit
+        self.draw(title, color, frequencies, month_counts)
+        if pdf is not None:
+            pdf.savefig(self.figure)
+            return None
+        path = os.path.join(self.out_dir, f"{stem}.{self.fmt}")
+        self.figure.savefig(path, format=self.fmt)
+        return path
+
+
+_report_renderer = None  # The ReportRenderer of a report worker process
+
+
+def init_report_worker(fmt, out_dir, week_labels, report_day):
+    """Process pool initializer: build the worker's figure once."""
+    global _report_renderer
+    _report_renderer = ReportRenderer(fmt, out_dir, week_labels, report_day)
+
+
+def render_report_batch(batch, pdf_dir=None):
+    """Render a batch of habit payloads in a worker; with pdf_dir they become the pages of one PDF there."""
+    if pdf_dir is None:
+        return [_report_renderer.render(habit) for habit in batch]
+    from matplotlib.backends.backend_pdf import PdfPages
+    pdf_path = os.path.join(pdf_dir, f"{uuid.uuid4().hex}.pdf")
+    with PdfPages(pdf_path) as pdf:
+        for habit in batch:
+            _report_renderer.render(habit, pdf)
+    return [pdf_path]
+
+
+def report_file_stem(habit):
+    """File name for a habit's report: its text made filesystem-safe plus the start of its id."""
+    slug = "".join(c if c.isalnum() else "-" for c in habit.text.lower()).strip("-")[:40]
+    return f"{slug or 'habit'}-{habit.id[:8]}"
+
+
+def render_report(app, output, fmt="png", jobs=None, report_day=None):
+    """Render every habit's weekly chart and month calendar with the Agg backend; return the files written.
+
+    PNG and SVG give one file per habit in the output directory; PDF gives
+    one file with a page per habit. Habits are sent in batches to a pool of
+    ``jobs`` processes (one per core by default), each reusing one figure.
+    A PDF is written in parts and joined with pypdf; without pypdf it is
+    rendered by a single process. Without habits nothing is written. Needs
+    matplotlib.
+    """
+    report_day = report_day or date.fromisoformat(app.today)
+    week_start = report_day.toordinal() - report_day.weekday()
+    month_start = date(report_day.year, report_day.month, 1).toordinal()
+    month_end = month_start + calendar.monthrange(report_day.year, report_day.month)[1] - 1
+    week_labels = [date.fromordinal(week_start + i).strftime("%a %m-%d") for i in range(7)]
+    payloads = []
+    for mode, habits, color in (('each_time', app.each_time_habits, "#14B8A6"),
+                                ('same_day', app.daily_habits, "#4B5EAA")):
+        for habit in habits:
+            index = app.completion_index(habit)
+            month_counts = bytearray(month_end - month_start + 1)
+            for ordinal, count in index.runs_between(month_start, month_end):
+                month_counts[ordinal - month_start] = min(count, 255)
+            payloads.append((
+                report_file_stem(habit), habit.text, color,
+                [index.count(week_start + i) for i in range(7)], bytes(month_counts)
+            ))
+    if not payloads:
+        return []  # Nothing to draw; an empty PDF would not even be written
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(payloads)))
+    if fmt != "pdf":
+        os.makedirs(output, exist_ok=True)
+        worker_args = (fmt, output, week_labels, report_day)
+        return map_in_batches(render_report_batch, payloads, jobs,
+                              initializer=init_report_worker, initargs=worker_args)
+
+    import shutil
+    import tempfile
+    merge = lazy_import("pypdf") if jobs > 1 else None
+    jobs = jobs if merge else 1
+    parts_dir = tempfile.mkdtemp(prefix=".report-", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        parts = map_in_batches(render_report_batch, payloads, jobs, parts_dir,
+                               initializer=init_report_worker, initargs=(fmt, None, week_labels, report_day))
+        if len(parts) == 1:
+            os.replace(parts[0], output)
+            return [output]
+        writer = merge.PdfWriter()
+        for part in parts:
+            writer.append(part)
+        with open(output, "wb") as out:
+            writer.write(out)
+        return [output]
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
 
 class HabitTrackerApp:
-    def __init__(self, root=None):
+    def __init__(self, root=None, save_debounce=SAVE_DEBOUNCE_SECONDS, storage="json", interactive=True,
+                 start_in_tray=False, directory="."):
         self.today = datetime.now().date().isoformat()
-        self.habits_data = self.load_habits()
-        self.each_time_habits = self.habits_data.get('each_time_habits', [])
-        self.daily_habits = self.habits_data.get('daily_habits', [])
+        self.store = open_store(storage, directory)
+        self.data_version = 0  # Bumped on every change
+        self.habit_versions = {}  # habit uid -> number of changes, keys chart caches
+        self.weekly_cache = OrderedDict()  # LRU of weekly frequency vectors
+        self.weekly_charts = {}  # graph frame -> WeeklyBarChart
+        self.calendar_views = {}  # graph frame -> CalendarView
+        self.analytics_cache = (None, None)  # (data version, today) -> stats per habit id
+        habits_data = self.load_habits()
+        self.registry = HabitRegistry(habits_data['each_time_habits'], habits_data['daily_habits'])
+        self.saver = SaveWorker(self.store, save_debounce)
+        atexit.register(self.close_storage)
         self.increment_mode = 'same_day'
         self.root = root
         self.current_habit = None
-        self.icon = None  # For the system tray icon
+        self.icon = None  # System tray icon; created once and shown or hidden with the window
+        self.tray_entries = ((), 0)  # (uid, label, checked) per tray habit and the count left out
+        self.in_tray = False
+        self.teardown_job = None
+        self.main_frame = None  # None while the window's widgets are torn down
 
         if root:
             self.root.title("Habit Tracker")
             self.root.geometry("400x500")
             self.root.configure(bg="#F3F4F6")
-            self.setup_gui()
-            self.render_habits()
+            if start_in_tray:
+                self.hide_window()
+            if self.main_frame is None and not self.in_tray:
+                self.setup_gui()
+                self.render_habits()
+            self.root.after(EXTERNAL_POLL_MS, self.poll_external_changes)
+            self.schedule_day_rollover()
             # Set up system tray on window close
             self.root.protocol('WM_DELETE_WINDOW', self.hide_window)
-        else:
+        elif interactive:
             self.run_console_mode()
 
+    @property
+    def each_time_habits(self):
+        return self.registry.habits('each_time')
+
+    @property
+    def daily_habits(self):
+        return self.registry.habits('same_day')
+
+    @property
+    def gui_ready(self):
+        """Whether the main window's widgets exist (they are torn down while in the tray)."""
+        return self.root is not None and self.main_frame is not None
+
     def setup_gui(self):
         """Set up the main GUI window with frames, buttons, and a scrollable canvas."""
         self.main_frame = tk.Frame(self.root, bg="#F3F4F6")
@@ -79,81 +2196,168 @@ class HabitTrackerApp:
         self.scrollbar = ttk.Scrollbar(self.main_frame, orient="vertical", command=self.canvas.yview)
         self.scrollable_frame = tk.Frame(self.canvas, bg="#F3F4F6")
 
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollable_frame.bind("<Configure>", self.on_list_configure)
+        self.canvas.configure(yscrollcommand=self.on_canvas_scroll)
+        self.canvas.bind("<Configure>", lambda e: self.virtual_list.refresh())
         self.scrollbar.pack(side="right", fill="y")
         self.canvas.pack(fill="both", expand=True, pady=(5, 0))
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.list_window = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.virtual_list = VirtualHabitList(self, self.canvas)
+
+        # One container per mode so switching modes swaps frames instead of rebuilding rows
+        self.mode_frames = {
+            mode: tk.Frame(self.scrollable_frame, bg="#F3F4F6") for mode in ('same_day', 'each_time')
+        }
+        self.habit_rows = {mode: {} for mode in self.mode_frames}
 
         tk.Button(
             self.main_frame, text="View Stats", command=self.open_stats_window,
             bg="#8B5CF6", fg="white", font=("Arial", 10, "bold")
         ).pack(pady=5)
+        self.root.bind("<F12>", self.open_debug_panel)
+
+    def on_list_configure(self, event):
+        """Size the scroll region from the habit frame itself rather than a bbox of every item."""
+        if not self.virtual_list.active:
+            self.canvas.configure(scrollregion=(0, 0, event.width, event.height))
+
+    def on_canvas_scroll(self, first, last):
+        """Update the scrollbar and re-bind virtual rows to the newly visible habits."""
+        self.scrollbar.set(first, last)
+        self.virtual_list.refresh()
 
     def toggle_increment_mode(self):
         """Toggle between 'Daily' and 'Each Time' modes."""
         try:
             self.increment_mode = 'each_time' if self.increment_mode == 'same_day' else 'same_day'
-            print(f"Switched to mode: {self.increment_mode}")
             if self.root:
-                mode_text = "Daily" if self.increment_mode == 'same_day' else "Each Time"
-                mode_color = "#4B5EAA" if self.increment_mode == 'same_day' else "#14B8A6"
-                self.header_label.configure(text=f"Habit Tracker - {mode_text} Mode", bg=mode_color)
-                self.header_frame.configure(bg=mode_color)
-                self.mode_button.configure(bg=mode_color)
+                self.update_mode_header()
                 self.render_habits()
                 self.root.update()
+            else:
+                print(f"Switched to mode: {self.increment_mode}")
         except Exception as e:
             print(f"Error toggling mode: {e}")
             if self.root:
                 messagebox.showerror("Error", "Failed to toggle mode")
 
+    def update_mode_header(self):
+        """Show the current mode's name and color in the header."""
+        mode_text = "Daily" if self.increment_mode == 'same_day' else "Each Time"
+        mode_color = "#4B5EAA" if self.increment_mode == 'same_day' else "#14B8A6"
+        self.header_label.configure(text=f"Habit Tracker - {mode_text} Mode", bg=mode_color)
+        self.header_frame.configure(bg=mode_color)
+        self.mode_button.configure(bg=mode_color)
+
+    @instruments.timed('render')
     def render_habits(self):
-        """Render the list of habits in the scrollable frame."""
+        """Sync the cached habit rows of the current mode with its habit list and show them.
+
+        Rows are kept per mode and keyed by habit id, so only rows that are
+        missing, removed or changed touch Tk; switching modes just swaps frames.
+        """
         try:
-            for widget in self.scrollable_frame.winfo_children():
-                widget.destroy()
+            mode = self.increment_mode
+            habits = self.each_time_habits if mode == 'each_time' else self.daily_habits
+            rows = self.habit_rows[mode]
+            if len(habits) > VIRTUAL_LIST_THRESHOLD:
+                for row in rows.values():
+                    row["frame"].destroy()
+                rows.clear()
+                self.canvas.itemconfigure(self.list_window, state="hidden")
+                self.virtual_list.show(habits, mode)
+                return
+            was_virtual = self.virtual_list.active
+            if was_virtual:
+                self.virtual_list.hide()
+                self.canvas.itemconfigure(self.list_window, state="normal")
 
-            habits = self.each_time_habits if self.increment_mode == 'each_time' else self.daily_habits
+            live_ids = {habit.uid for habit in habits}
+            for habit_id in [habit_id for habit_id in rows if habit_id not in live_ids]:
+                rows.pop(habit_id)["frame"].destroy()
             for habit in habits:
-                frame = tk.Frame(self.scrollable_frame, bg="white", bd=2, highlightthickness=0)
-                frame.pack(fill="x", pady=5, padx=5)
+                row = rows.get(habit.uid)
+                if row is None:
+                    self.add_habit_row(habit, mode)
+                else:
+                    self.refresh_habit_row(row, habit, mode)
+
+            for other_mode, frame in self.mode_frames.items():
+                if other_mode != mode:
+                    frame.pack_forget()
+            self.mode_frames[mode].pack(fill="x")
+            if was_virtual:
+                # The frame may keep its size, so no <Configure> would restore the scroll region
+                self.scrollable_frame.update_idletasks()
+                self.canvas.configure(scrollregion=(
+                    0, 0, self.scrollable_frame.winfo_reqwidth(), self.scrollable_frame.winfo_reqheight()
+                ))
+        except Exception as e:
+            print(f"Error rendering habits: {e}")
+            if self.root:
+                messagebox.showerror("Error", "Failed to render habits")
 
-                frame.grid_columnconfigure(0, weight=1)
+    def create_habit_row(self, parent, habit, mode):
+        """Create the (unplaced) widgets for one habit row and return them keyed by role."""
+        frame = tk.Frame(parent, bg="white", bd=2, highlightthickness=0)
 
-                tk.Label(frame, text="", bg="white").grid(row=0, column=0)
+        frame.grid_columnconfigure(0, weight=1)
 
-                habit_area = tk.Frame(frame, bg="white")
-                habit_area.grid(row=0, column=1, sticky="e", padx=5)
+        tk.Label(frame, text="", bg="white").grid(row=0, column=0)
 
-                label = tk.Label(
-                    habit_area, text=habit["text"], font=("Arial", 10), bg="white",
-                    fg="gray" if habit["completed"] and self.increment_mode == 'same_day' else "black",
-                    wraplength=200, anchor="w", padx=10, pady=5
-                )
-                label.pack(side="left")
+        habit_area = tk.Frame(frame, bg="white")
+        habit_area.grid(row=0, column=1, sticky="e", padx=5)
 
-                button_frame = tk.Frame(habit_area, bg="white")
-                button_frame.pack(side="left", padx=5)
+        label = tk.Label(
+            habit_area, font=("Arial", 10), bg="white",
+            wraplength=200, anchor="w", padx=10, pady=5
+        )
+        label.pack(side="left")
 
-                text = "Complete" if not (self.increment_mode == 'same_day' and habit["completed"]) else "✔"
-                bg = "#10B981" if text == "Complete" else "#FBBF24"
-                tk.Button(
-                    button_frame, text=text, command=lambda id=habit["id"]: self.toggle_habit_completion(id),
-                    bg=bg, fg="white", font=("Arial", 9, "bold")
-                ).pack(side="left", padx=2)
+        button_frame = tk.Frame(habit_area, bg="white")
+        button_frame.pack(side="left", padx=5)
 
-                tk.Button(
-                    button_frame, text="Delete", command=lambda id=habit["id"]: self.delete_habit(id),
-                    bg="#EF4444", fg="white", font=("Arial", 9, "bold")
-                ).pack(side="left", padx=2)
+        # Commands read the id from the row so recycled virtual rows follow their current habit
+        row = {"habit_id": habit.uid, "frame": frame, "label": label, "state": None}
+        row["button"] = tk.Button(
+            button_frame, command=lambda: self.toggle_habit_completion(row["habit_id"]),
+            fg="white", font=("Arial", 9, "bold")
+        )
+        row["button"].pack(side="left", padx=2)
 
-                print(f"Rendered habit area: {habit['text']}, habit name: left of buttons, habit area: right-aligned (grid column 1, sticky=e)")
-        except Exception as e:
-            print(f"Error rendering habits: {e}")
-            if self.root:
-                messagebox.showerror("Error", "Failed to render habits")
+        tk.Button(
+            button_frame, text="Delete", command=lambda: self.delete_habit(row["habit_id"]),
+            bg="#EF4444", fg="white", font=("Arial", 9, "bold")
+        ).pack(side="left", padx=2)
 
+        self.refresh_habit_row(row, habit, mode)
+        if instruments.enabled:
+            instruments.count("widgets_created", widget_count(frame))
+        return row
+
+    def refresh_habit_row(self, row, habit, mode):
+        """Reconfigure a cached row only if the habit's text or completion changed."""
+        done = mode == 'same_day' and habit.completed
+        state = (habit.text, done)
+        if row["state"] == state:
+            return
+        row["state"] = state
+        row["label"].configure(text=habit.text, fg="gray" if done else "black")
+        row["button"].configure(text="✔" if done else "Complete", bg="#FBBF24" if done else "#10B981")
+
+    def add_habit_row(self, habit, mode):
+        """Append a row for a newly added habit to its mode's list."""
+        row = self.create_habit_row(self.mode_frames[mode], habit, mode)
+        row["frame"].pack(fill="x", pady=5, padx=5)
+        self.habit_rows[mode][habit.uid] = row
+
+    def remove_habit_row(self, habit_id, mode):
+        """Destroy the row of a deleted habit."""
+        row = self.habit_rows[mode].pop(habit_id, None)
+        if row:
+            row["frame"].destroy()
+
+    @instruments.timed('stats_window')
     def open_stats_window(self):
         """Open a new window to display habit completion stats."""
         try:
@@ -180,6 +2384,9 @@ class HabitTrackerApp:
             canvas.pack(fill="both", expand=True)
             canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
 
+            # Charts of an earlier stats window died with it
+            self.weekly_charts = {}
+            self.calendar_views = {}
             self.render_habit_stats(scrollable_frame, "Each Time Mode", self.each_time_habits, "#14B8A6")
             self.each_time_graph_frame = tk.Frame(scrollable_frame, bg="#F3F4F6")
             self.each_time_graph_frame.pack(fill="x", pady=(10, 10), padx=5)
@@ -188,12 +2395,61 @@ class HabitTrackerApp:
             self.daily_graph_frame = tk.Frame(scrollable_frame, bg="#F3F4F6")
             self.daily_graph_frame.pack(fill="x", pady=(10, 10), padx=5)
 
-            print("Opened stats window successfully")
+            tk.Button(
+                scrollable_frame, text="Year Heatmap (All Habits)", command=self.open_year_heatmap,
+                bg="#4B5EAA", fg="white", font=("Arial", 10, "bold")
+            ).pack(pady=(0, 10))
+
+            if instruments.enabled:
+                instruments.count("widgets_created", widget_count(stats_window))
         except Exception as e:
             print(f"Error opening stats window: {e}")
             if self.root:
                 messagebox.showerror("Error", "Failed to open stats window")
 
+    def open_debug_panel(self, event=None):
+        """Show the instrumentation spans and counters in a small window (F12)."""
+        try:
+            window = tk.Toplevel(self.root)
+            window.title("Diagnostics")
+            window.geometry("560x420")
+            window.configure(bg="#F3F4F6")
+            buttons = tk.Frame(window, bg="#F3F4F6")
+            buttons.pack(fill="x", padx=10, pady=5)
+            text = tk.Text(window, font=("Courier", 9), wrap="none", bg="white")
+            text.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+            def refresh():
+                text.configure(state="normal")
+                text.delete("1.0", tk.END)
+                text.insert(tk.END, format_report(instruments.report()))
+                text.configure(state="disabled")
+
+            def start():
+                instruments.enable("spans", None)
+                refresh()
+
+            def export():
+                path = instruments.export(instruments.export_path or PROFILE_FILE)
+                messagebox.showinfo("Diagnostics", f"Saved {os.path.abspath(path)}", parent=window)
+
+            def reset():
+                instruments.reset()
+                refresh()
+
+            actions = [("Refresh", refresh), ("Export JSON", export), ("Reset", reset)]
+            if not instruments.enabled:
+                actions.insert(0, ("Start", start))
+            for label, command in actions:
+                tk.Button(
+                    buttons, text=label, command=command, bg="#4B5EAA", fg="white", font=("Arial", 9, "bold")
+                ).pack(side="left", padx=2)
+            refresh()
+        except Exception as e:
+            print(f"Error opening diagnostics: {e}")
+            if self.root:
+                messagebox.showerror("Error", "Failed to open diagnostics")
+
     def render_habit_stats(self, parent, mode_name, habits, color):
         """Render the list of habits and their completion stats in the stats window."""
         tk.Label(
@@ -206,157 +2462,264 @@ class HabitTrackerApp:
                 fg="gray", bg="#F3F4F6", anchor="w", padx=10
             ).pack(anchor="w")
         else:
+            stats = self.analytics()
             for habit in habits:
                 frame = tk.Frame(parent, bg="white")
                 frame.pack(fill="x", pady=2, padx=5)
                 label = tk.Label(
-                    frame, text=f"{habit['text']}: {habit['completionCount']} times",
+                    frame, text=f"{habit.text}: {habit.completion_count} times",
                     font=("Arial", 10), bg="white", anchor="w", padx=10, pady=5, cursor="hand2"
                 )
-                label.pack(side="left")
+                label.pack(anchor="w")
                 label.bind("<Button-1>", lambda e, h=habit: self.show_habit_graph(h, color))
+                if stats:
+                    tk.Label(
+                        frame, text=describe_stats(stats[habit.uid]), font=("Arial", 8),
+                        fg="gray", bg="white", anchor="w", padx=10, wraplength=340, justify="left"
+                    ).pack(anchor="w", pady=(0, 5))
+
+    def analytics(self):
+        """Stats for every habit from compute_analytics, recomputed once per data version.
+
+        Returns None when NumPy is not installed.
+        """
+        np = lazy_import("numpy")
+        if np is None:
+            return None
+        key = (self.data_version, self.today)
+        if self.analytics_cache[0] != key:
+            habits = self.each_time_habits + self.daily_habits
+            indexes = [self.completion_index(h) for h in habits]
+            today_ordinal = date.fromisoformat(self.today).toordinal()
+            started = time.perf_counter()
+            self.analytics_cache = (key, compute_analytics(np, habits, indexes, today_ordinal))
+            instruments.record("analytics", time.perf_counter() - started)
+        return self.analytics_cache[1]
 
     def show_habit_graph(self, habit, color):
         """Display the graph or completion view for the selected habit."""
-        graph_frame = self.each_time_graph_frame if habit in self.each_time_habits else self.daily_graph_frame
-        for widget in graph_frame.winfo_children():
-            widget.destroy()
+        each_time = self.registry.mode_of(habit) == 'each_time'
+        graph_frame = self.each_time_graph_frame if each_time else self.daily_graph_frame
+        if graph_frame not in self.weekly_charts and graph_frame not in self.calendar_views:
+            # Charts and calendars are reused in place once they exist
+            for widget in graph_frame.winfo_children():
+                widget.destroy()
         self.create_completion_graph(graph_frame, habit, color)
         self.current_habit = habit
 
+    def weekly_frequencies(self, habit):
+        """Return (completions per day, day labels) for the current week, cached per habit version."""
+        today = datetime.now().date()
+        start_date = today - timedelta(days=today.weekday())
+        key = (habit.uid, self.habit_versions.get(habit.uid, 0), start_date.toordinal())
+        cached = self.weekly_cache.get(key)
+        if cached is not None:
+            self.weekly_cache.move_to_end(key)
+            return cached
+
+        index = self.range_index(habit, start_date, start_date + timedelta(days=6))
+        dates = [start_date + timedelta(days=x) for x in range(7)]
+        frequencies = [index.count(d.toordinal()) for d in dates]
+        date_labels = [d.strftime("%a %m-%d") for d in dates]
+        self.weekly_cache[key] = (frequencies, date_labels)
+        if len(self.weekly_cache) > CHART_CACHE_SIZE:
+            self.weekly_cache.popitem(last=False)
+        return frequencies, date_labels
+
+    @instruments.timed('chart')
     def create_completion_graph(self, parent_frame, habit, color):
         """Create the appropriate graph or completion view for the habit."""
-        if habit in self.daily_habits:
+        if self.registry.mode_of(habit) == 'same_day':
             self.create_completion_view(parent_frame, habit, color)
         else:
             # Bar graph for Each Time Mode
-            date_counts = {date: habit.get('completionDates', []).count(date) for date in set(habit.get('completionDates', []))}
+            frequencies, date_labels = self.weekly_frequencies(habit)
+            y_ticks = weekly_y_ticks(max(frequencies, default=0))
 
-            today = datetime.now().date()
-            days_since_monday = today.weekday()
-            start_date = today - timedelta(days=days_since_monday)
-            dates = [start_date + timedelta(days=x) for x in range(7)]
-            date_strings = [d.isoformat() for d in dates]
-            frequencies = [date_counts.get(date, 0) for date in date_strings]
-            date_labels = [d.strftime("%a %m-%d") for d in dates]
-
-            max_freq = max(frequencies, default=0)
-            if max_freq == 0:
-                y_ticks = [0, 1]
-            elif max_freq <= 3:
-                y_ticks = list(range(0, max_freq + 1, 1))
-            else:
-                step = max(1, math.ceil(max_freq / 3))
-                y_ticks = list(range(0, max_freq + step, step))
-
-            fig, ax = plt.subplots(figsize=(4, 2.5))
-            ax.bar(range(len(frequencies)), frequencies, color=color)
-            ax.set_xticks(range(len(date_labels)))
-            ax.set_xticklabels(date_labels, rotation=45, ha="right", fontsize=8)
-            ax.set_xlabel("Date", fontsize=8)
-            ax.set_ylabel("Completions", fontsize=8)
-            ax.set_yticks(y_ticks)
-            ax.tick_params(axis='y', labelsize=8)
-            plt.title(f"{habit['text']}", fontsize=10)
-            plt.tight_layout()
-
-            canvas = FigureCanvasTkAgg(fig, master=parent_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill="x", pady=5)
-            plt.close(fig)
+            chart = self.weekly_charts.get(parent_frame)
+            if chart is None:
+                figure_module = lazy_import("matplotlib.figure")
+                backend = lazy_import("matplotlib.backends.backend_tkagg")
+                if figure_module is None or backend is None:
+                    tk.Label(
+                        parent_frame, text="Install matplotlib to see completion graphs",
+                        font=("Arial", 10, "italic"), fg="gray", bg="#F3F4F6"
+                    ).pack(anchor="w")
+                    return
+                chart = WeeklyBarChart(parent_frame, figure_module, backend)
+                self.weekly_charts[parent_frame] = chart
+                instruments.count("charts_created")
+            chart.update(habit.text, frequencies, date_labels, y_ticks, color)
 
     def create_completion_view(self, parent_frame, habit, color):
-        """Display a list of dates for the current month with completion status."""
-        # Get the current month and year
+        """Draw the completion calendar of a daily habit on the frame's single canvas."""
+        view = self.calendar_views.get(parent_frame)
+        if view is None:
+            view = CalendarView(parent_frame)
+            self.calendar_views[parent_frame] = view
+            instruments.count("charts_created")
         today = datetime.now().date()
-        year = today.year
-        month = today.month
-        today_day = today.day  # e.g., 3 for May 3, 2025
-
-        # Get the number of days in the current month
-        _, num_days = calendar.monthrange(year, month)
-        month_name = calendar.month_name[month]
-
-        # Get completion dates for the habit
-        completion_dates = habit.get('completionDates', [])
-        print(f"Completion dates for habit {habit['text']}: {completion_dates}")
-
-        # Create a frame for the completion view
-        completion_frame = tk.Frame(parent_frame, bg="#F3F4F6")
-        completion_frame.pack(fill="x", pady=5)
-
-        # Add the month and year title
-        tk.Label(
-            completion_frame, text=f"{month_name} {year}", font=("Arial", 10, "bold"),
-            fg=color, bg="#F3F4F6"
-        ).pack(anchor="w")
-
-        # Create a grid to display dates and their completion status
-        date_grid = tk.Frame(completion_frame, bg="#F3F4F6")
-        date_grid.pack(fill="x")
+        start = min(heatmap_start(today), today.replace(day=1) - timedelta(days=92))
+        view.show(habit.text, self.range_index(habit, start, today + timedelta(days=31)), color)
 
-        # Display each day of the month
-        for day in range(1, num_days + 1):
-            date_str = f"{year}-{month:02d}-{day:02d}"
-            col = (day - 1) % 7  # 7 columns per row
-            row = (day - 1) // 7
+    @instruments.timed('heatmap')
+    def open_year_heatmap(self):
+        """Open a window with last year's heatmap of every habit drawn as one image."""
+        try:
+            habits = self.daily_habits + self.each_time_habits
+            window = tk.Toplevel(self.root)
+            window.title("Year Heatmap")
+            window.geometry("460x500")
+            window.configure(bg="#F3F4F6")
 
-            # Create a frame for the date and its status
-            day_frame = tk.Frame(date_grid, bg="white", borderwidth=1, relief="solid")
-            day_frame.grid(row=row * 2, column=col, padx=2, pady=2)
+            canvas = tk.Canvas(window, bg="#F3F4F6", highlightthickness=0)
+            scrollbar = ttk.Scrollbar(window, orient="vertical", command=canvas.yview)
+            canvas.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            canvas.pack(fill="both", expand=True, padx=10, pady=10)
 
-            # Display the date
-            tk.Label(
-                day_frame, text=str(day), font=("Arial", 8),
-                bg="white", fg="black", width=5
-            ).pack()
-
-            # Determine the status: tick (✅), wrong (❌), or white square (⬜)
-            if date_str in completion_dates:
-                # Habit was completed on this day
-                tk.Label(
-                    day_frame, text="✅", font=("Arial", 10),
-                    bg="white", fg="green"
-                ).pack()
-            elif day < today_day:
-                # Previous day, habit not completed
-                tk.Label(
-                    day_frame, text="❌", font=("Arial", 10),
-                    bg="white", fg="red"
-                ).pack()
-            else:
-                # Future day (day >= today_day), show white square
-                tk.Label(
-                    day_frame, text="⬜", font=("Arial", 10),
-                    bg="white", fg="black"
-                ).pack()
+            today = datetime.now().date()
+            start = heatmap_start(today).toordinal()
+            start_date = heatmap_start(today)
+            level_rows = [
+                completion_levels(
+                    self.range_index(h, start_date, today), start, HEATMAP_WEEKS * 7,
+                    4 if self.registry.mode_of(h) == 'same_day' else 1
+                )
+                for h in habits
+            ]
+            cell = CalendarView.HEATMAP_CELL
+            window.heatmap_image = year_heatmap_image(level_rows, today.toordinal(), start, cell)
+            label_width = 110
+            canvas.create_image(label_width, 0, image=window.heatmap_image, anchor="nw")
+            for i, habit in enumerate(habits):
+                canvas.create_text(
+                    0, i * 8 * cell + 3 * cell, text=habit.text[:16], anchor="w", font=("Arial", 8)
+                )
+            canvas.configure(scrollregion=(
+                0, 0, label_width + window.heatmap_image.width(), window.heatmap_image.height()
+            ))
+        except Exception as e:
+            print(f"Error opening year heatmap: {e}")
+            if self.root:
+                messagebox.showerror("Error", "Failed to open year heatmap")
 
     def hide_window(self):
-        """Hide the window and show it on the system tray."""
-        self.root.withdraw()  # Hide the window
-        # Create system tray icon if not already created
+        """Hide the window to the system tray; its widgets are torn down if it stays hidden.
+
+        The tray icon and its thread are created on the first hide and live
+        until quit; later hides only make the icon visible again.
+        """
+        pystray = lazy_import("pystray")
+        Image = lazy_import("PIL.Image")
+        if pystray is None or Image is None:
+            # No tray support installed; minimise instead of hiding for good
+            if self.main_frame is None:
+                self.setup_gui()
+                self.render_habits()
+            self.root.iconify()
+            return
+        self.root.withdraw()
+        self.in_tray = True
+        self.refresh_tray_menu()
         if not self.icon:
-            # Create an icon (you'll need an icon file, e.g., 'icon.ico')
             try:
                 image = Image.open("icon.ico")
             except FileNotFoundError:
                 # Fallback to a default icon if icon.ico is not found
                 image = Image.new('RGB', (64, 64), color='blue')
-            menu = (
-                pystray.MenuItem("Show", self.show_window),
-                pystray.MenuItem("Quit", self.quit_window)
+            self.icon = pystray.Icon("Habit Tracker", image, "Habit Tracker", pystray.Menu(self.tray_menu_items))
+
+            def setup(icon):
+                icon.visible = True
+            threading.Thread(target=self.icon.run, args=(setup,), daemon=True).start()
+        else:
+            self.icon.visible = True
+        if self.main_frame is not None and self.teardown_job is None:
+            self.teardown_job = self.root.after(TRAY_TEARDOWN_MS, self.teardown_gui)
+
+    def refresh_tray_menu(self):
+        """Snapshot the habits shown in the tray menu and have pystray rebuild it (runs on the Tk thread).
+
+        The menu is built on the tray thread, so it reads only this snapshot,
+        never the registry the Tk thread is changing.
+        """
+        entries, hidden = [], 0
+        for mode, habits in (('same_day', self.daily_habits), ('each_time', self.each_time_habits)):
+            hidden += max(0, len(habits) - TRAY_MENU_HABITS)
+            for habit in habits[:TRAY_MENU_HABITS]:
+                if mode == 'same_day':
+                    entries.append((habit.uid, habit.text, habit.completed))
+                else:
+                    entries.append((habit.uid, f"{habit.text} (+1)", None))
+        self.tray_entries = (tuple(entries), hidden)
+        if self.icon:
+            self.icon.update_menu()
+
+    def tray_menu_items(self):
+        """Build the tray menu: show, today's habits to complete, quit (runs on the tray thread).
+
+        pystray calls this again on every update_menu, so check marks and
+        habit names follow the snapshot from refresh_tray_menu without
+        recreating the icon.
+        """
+        pystray = lazy_import("pystray")
+        yield pystray.MenuItem("Show", self.tray_action(self.show_window), default=True)
+        yield pystray.Menu.SEPARATOR
+        entries, hidden = self.tray_entries
+        for uid, label, checked in entries:
+            yield pystray.MenuItem(
+                label, self.tray_action(self.tray_toggle, uid),
+                checked=None if checked is None else (lambda item, done=checked: done)
             )
-            self.icon = pystray.Icon("Habit Tracker", image, "Habit Tracker", menu)
-            # Run the system tray icon in a separate thread
-            tray_thread = threading.Thread(target=self.icon.run)
-            tray_thread.daemon = True
-            tray_thread.start()
+        if hidden:
+            yield pystray.MenuItem(f"{hidden} more in the window...", self.tray_action(self.show_window))
+        yield pystray.Menu.SEPARATOR
+        yield pystray.MenuItem("Quit", self.tray_action(self.quit_window))
+
+    def tray_action(self, func, *args):
+        """A pystray menu callback running func(*args) on the Tk thread; menu clicks arrive on the tray thread."""
+        return lambda icon, item: self.root.after(0, func, *args)
+
+    def tray_toggle(self, habit_id):
+        """Complete (or un-complete) a habit from the tray menu without rebuilding the window."""
+        self.toggle_habit_completion(habit_id)
+        self.refresh_tray_menu()
+
+    def teardown_gui(self):
+        """Destroy the hidden window's widgets, charts and stats windows and drop their caches."""
+        self.teardown_job = None
+        if not self.in_tray or self.main_frame is None:
+            return
+        try:
+            for child in self.root.winfo_children():
+                child.destroy()  # The main frame and every Toplevel: stats, heatmap, diagnostics
+            self.main_frame = None
+            self.habit_rows = {}
+            self.virtual_list = None
+            self.weekly_charts = {}
+            self.calendar_views = {}
+            self.weekly_cache.clear()
+            self.analytics_cache = (None, None)
+            self.current_habit = None
+            gc.collect()
+            trim_heap()
+            instruments.count("gui_teardowns")
+        except Exception as e:
+            print(f"Error releasing the window: {e}")
 
     def show_window(self):
-        """Show the window again from the system tray."""
+        """Show the window again from the system tray, rebuilding it if it was torn down."""
+        self.in_tray = False
+        if self.teardown_job is not None:
+            self.root.after_cancel(self.teardown_job)
+            self.teardown_job = None
         if self.icon:
-            self.icon.stop()
-            self.icon = None
+            self.icon.visible = False
+        if self.main_frame is None:
+            self.setup_gui()
+            self.update_mode_header()
+            self.render_habits()
         self.root.deiconify()
 
     def quit_window(self):
@@ -364,57 +2727,209 @@ class HabitTrackerApp:
         if self.icon:
             self.icon.stop()
             self.icon = None
+        self.close_storage()
         self.root.destroy()
 
+    @instruments.timed('load')
     def load_habits(self):
-        """Load habits from habits.json or return default empty data."""
+        """Load habits from the snapshot and event log or return default empty data."""
         try:
-            if os.path.exists("habits.json"):
-                with open("habits.json", "r") as f:
-                    data = json.load(f)
-                    if isinstance(data, list):
-                        habits = [
-                            h for h in data
-                            if isinstance(h, dict) and "id" in h and "text" in h
-                        ]
-                        for h in habits:
-                            h.setdefault("completionCount", 0)
-                            h.setdefault("completionDates", [])
-                            if h.get("lastCompleted") != self.today:
-                                h["completed"] = False
-                                h["lastCompleted"] = None
-                        return {'each_time_habits': [], 'daily_habits': habits}
-                    else:
-                        each_time = data.get('each_time_habits', [])
-                        daily = data.get('daily_habits', [])
-                        if not (isinstance(each_time, list) and isinstance(daily, list)):
-                            raise ValueError("Invalid habits data")
-                        for h in each_time + daily:
-                            if not isinstance(h, dict) or "id" not in h or "text" not in h:
-                                raise ValueError("Invalid habit entry")
-                            h.setdefault("completionCount", 0)
-                            h.setdefault("completionDates", [])
-                            if h.get("lastCompleted") != self.today:
-                                h["completed"] = False
-                                h["lastCompleted"] = None
-                        return {'each_time_habits': each_time, 'daily_habits': daily}
-            return {'each_time_habits': [], 'daily_habits': []}
+            return self.habits_from_data(self.store.load())
         except Exception as e:
             print(f"Error loading habits: {e}")
             return {'each_time_habits': [], 'daily_habits': []}
 
+    def habits_from_data(self, data):
+        """Validate raw habits data from the store and turn it into Habit objects."""
+        each_time = data.get('each_time_habits', [])
+        daily = data.get('daily_habits', [])
+        if not (isinstance(each_time, list) and isinstance(daily, list)):
+            raise ValueError("Invalid habits data")
+        for h in each_time + daily:
+            if not isinstance(h, dict) or "id" not in h or "text" not in h:
+                raise ValueError("Invalid habit entry")
+            if not self.store.lazy_history and "completionDates" not in h:
+                h.setdefault("history", CompletionIndex())
+            if h.get("lastCompleted") != self.today:
+                h["completed"] = False
+                h["lastCompleted"] = None
+        return {
+            'each_time_habits': [Habit.from_dict(h) for h in each_time],
+            'daily_habits': [Habit.from_dict(h) for h in daily]
+        }
+
+    def schedule_day_rollover(self):
+        """Arm a Tk timer that fires just after local midnight."""
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        delay = int((midnight - now).total_seconds() * 1000) + 500
+        self.root.after(min(delay, DAY_CHECK_MAX_MS), self.day_rollover_tick)
+
+    def day_rollover_tick(self):
+        self.roll_over_day()
+        self.schedule_day_rollover()
+
+    def roll_over_day(self):
+        """Move self.today to the current date and clear yesterday's daily check marks.
+
+        Only the habits that were completed change, and only their rows are
+        refreshed. Returns True if the date changed.
+        """
+        today = datetime.now().date().isoformat()
+        if today == self.today:
+            return False
+        try:
+            self.today = today
+            changed = []
+            for habit in self.daily_habits:
+                if habit.completed and habit.last_completed != today:
+                    habit.completed = False
+                    habit.last_completed = None
+                    changed.append(habit)
+            if self.gui_ready and self.virtual_list.active:
+                self.virtual_list.refresh()
+            elif self.gui_ready:
+                for habit in changed:
+                    row = self.habit_rows['same_day'].get(habit.uid)
+                    if row:
+                        self.refresh_habit_row(row, habit, 'same_day')
+            if changed and self.in_tray:
+                self.refresh_tray_menu()
+        except Exception as e:
+            print(f"Error starting the new day: {e}")
+        return True
+
+    @instruments.timed('sync')
+    def poll_external_changes(self):
+        """Merge changes other processes made to the store since the last poll.
+
+        Events are applied to the habits they touch; only when the store lost
+        track of them (a compaction or full save elsewhere) are the habits
+        reloaded and merged habit by habit.
+        """
+        try:
+            events, resync = self.store.poll()
+            instruments.count("external_events", len(events))
+            if resync:
+                instruments.count("resyncs")
+                self.saver.flush()  # Our queued changes must reach disk before it is re-read
+                self.merge_habits(self.habits_from_data(self.store.load()))
+            for event in events:
+                self.apply_external_event(event)
+            if (events or resync) and self.gui_ready:
+                self.render_habits()
+            if (events or resync) and self.in_tray:
+                self.refresh_tray_menu()
+        except Exception as e:
+            print(f"Error syncing habits: {e}")
+        if self.root:
+            self.root.after(TRAY_POLL_MS if self.in_tray else EXTERNAL_POLL_MS, self.poll_external_changes)
+
+    def apply_external_event(self, event):
+        """Apply one event written by another process to the habits in memory."""
+        op = event.get("op")
+        if op == "add":
+            habit = Habit.from_dict(event["habit"])
+            if self.registry.get(habit.uid)[0] is None:
+                self.registry.add(habit, 'each_time' if event.get("mode") == 'each_time' else 'same_day')
+            self.bump_version(habit.uid)
+            return
+        habit, mode = self.registry.get(habit_uid(event.get("id", "")))
+        if habit is None:
+            return
+        if op == "delete":
+            self.registry.remove(habit.uid)
+        elif op in ("complete", "import"):
+            for day in (event["dates"] if op == "import" else [event["date"]]):
+                self.mark_completed(habit, mode, day, record=False)
+        elif op == "uncomplete":
+            ordinal = iso_to_ordinal(event["date"])
+            habit.completed = False
+            habit.last_completed = None
+            if ordinal in self.completion_index(habit):
+                habit.remove_completion(ordinal)
+        self.bump_version(habit.uid)
+
+    def merge_habits(self, habits_data):
+        """Bring the registry in line with freshly loaded habits, touching only those that differ."""
+        loaded = set()
+        for key, mode in (('each_time_habits', 'each_time'), ('daily_habits', 'same_day')):
+            for habit in habits_data[key]:
+                loaded.add(habit.uid)
+                current, current_mode = self.registry.get(habit.uid)
+                if current is None or current_mode != mode:
+                    self.registry.add(habit, mode)
+                elif (current.text, current.completed, current.last_completed, current.completion_count,
+                      current.history) != (habit.text, habit.completed, habit.last_completed,
+                                           habit.completion_count, habit.history):
+                    current.update_from(habit)  # A lazily loaded copy re-reads its history on demand
+                else:
+                    continue
+                self.bump_version(habit.uid)
+        for habit in self.each_time_habits + self.daily_habits:
+            if habit.uid not in loaded:
+                self.registry.remove(habit.uid)
+                self.bump_version(habit.uid)
+
+    def bump_version(self, habit_id):
+        """Invalidate the caches that depend on one habit (by uid) and on the data as a whole."""
+        self.data_version += 1
+        self.habit_versions[habit_id] = self.habit_versions.get(habit_id, 0) + 1
+
     def save_habits(self):
-        """Save habits to habits.json."""
+        """Queue a full snapshot of all habits for habits.json; the save worker writes it."""
         try:
+            for habit in self.each_time_habits + self.daily_habits:
+                self.ensure_history(habit)
             data = {
-                'each_time_habits': self.each_time_habits,
-                'daily_habits': self.daily_habits
+                'each_time_habits': [h.to_dict() for h in self.each_time_habits],
+                'daily_habits': [h.to_dict() for h in self.daily_habits]
             }
-            with open("habits.json", "w") as f:
-                json.dump(data, f, indent=2)
+            self.saver.submit_snapshot(data)
         except Exception as e:
             print(f"Error saving habits: {e}")
 
+    def close_storage(self):
+        """Flush queued changes to disk and release the storage files."""
+        atexit.unregister(self.close_storage)  # Closed already; the shard may be gone by exit
+        try:
+            self.saver.close()
+            self.store.close()
+        except Exception as e:
+            print(f"Error saving habits: {e}")
+
+    def ensure_history(self, habit):
+        """Fetch the completion history from the store for a habit loaded without it."""
+        if habit.history is None:
+            habit.history = self.store.load_history(habit.id)
+
+    def completion_index(self, habit):
+        """Return the habit's CompletionIndex, loading its history first if needed."""
+        self.ensure_history(habit)
+        return habit.history
+
+    def range_index(self, habit, start, end):
+        """CompletionIndex covering at least [start, end], without loading unused history."""
+        if habit.history is not None or not self.store.range_queries:
+            return self.completion_index(habit)
+        return CompletionIndex.from_counts(self.store.completion_counts(habit.id, start, end))
+
+    def record_event(self, event):
+        """Append a single change to the event log instead of rewriting every habit."""
+        self.bump_version(habit_uid(event["habit"]["id"] if event["op"] == "add" else event["id"]))
+        instruments.count("events_recorded")
+        try:
+            self.saver.submit_event(event)
+        except Exception as e:
+            print(f"Error saving habits: {e}")
+
+    def create_habit(self, text, mode):
+        """Register a new habit with an empty history in mode, log it and return it."""
+        habit = Habit(str(uuid.uuid4()), text, history=CompletionIndex())
+        self.registry.add(habit, mode)
+        self.record_event({"op": "add", "mode": mode, "habit": habit.to_dict()})
+        return habit
+
     def add_habit(self, habit_text=None):
         """Add a new habit to the appropriate list (Daily or Each Time)."""
         try:
@@ -422,22 +2937,13 @@ class HabitTrackerApp:
                 habit_text = self.habit_input.get().strip()
             if not habit_text:
                 raise ValueError("Habit cannot be empty")
-            new_habit = {
-                "id": str(uuid.uuid4()),
-                "text": habit_text,
-                "completed": False,
-                "lastCompleted": None,
-                "completionCount": 0,
-                "completionDates": []
-            }
-            if self.increment_mode == 'each_time':
-                self.each_time_habits.append(new_habit)
-            else:
-                self.daily_habits.append(new_habit)
-            self.save_habits()
+            new_habit = self.create_habit(habit_text, self.increment_mode)
             if self.root:
                 self.habit_input.delete(0, tk.END)
-                self.render_habits()
+                if self.virtual_list.active or self.registry.count(self.increment_mode) > VIRTUAL_LIST_THRESHOLD:
+                    self.render_habits()
+                else:
+                    self.add_habit_row(new_habit, self.increment_mode)
             else:
                 print("Habit added")
         except Exception as e:
@@ -445,31 +2951,36 @@ class HabitTrackerApp:
             if self.root:
                 messagebox.showerror("Error", "Failed to add habit")
 
+    @instruments.timed('toggle')
     def toggle_habit_completion(self, habit_id):
         """Toggle the completion status of a habit."""
         try:
-            habits = self.each_time_habits if self.increment_mode == 'each_time' else self.daily_habits
-            for habit in habits:
-                if habit["id"] == habit_id:
-                    if self.increment_mode == 'each_time':
-                        habit["completionCount"] += 1
-                        habit["completionDates"].append(self.today)
-                    else:
-                        habit["completed"] = not habit["completed"]
-                        if habit["completed"]:
-                            habit["lastCompleted"] = self.today
-                            if self.today not in habit["completionDates"]:
-                                habit["completionCount"] += 1
-                                habit["completionDates"].append(self.today)
-                        else:
-                            habit["lastCompleted"] = None
-                            if self.today in habit["completionDates"]:
-                                habit["completionCount"] -= 1
-                                habit["completionDates"].remove(self.today)
-                    break
-            self.save_habits()
-            if self.root:
-                self.render_habits()
+            self.roll_over_day()  # A click just past midnight, before the timer fires, is for the new day
+            habit, mode = self.registry.get(habit_id)
+            if habit is None:
+                return
+            index = self.completion_index(habit)
+            today_ordinal = iso_to_ordinal(self.today)
+            if mode == 'each_time':
+                habit.add_completion(today_ordinal)
+            else:
+                habit.completed = not habit.completed
+                if habit.completed:
+                    habit.last_completed = self.today
+                    if today_ordinal not in index:
+                        habit.add_completion(today_ordinal)
+                else:
+                    habit.last_completed = None
+                    if today_ordinal in index:
+                        habit.remove_completion(today_ordinal)
+            op = "complete" if mode == 'each_time' or habit.completed else "uncomplete"
+            self.record_event({"op": op, "id": habit.id, "date": self.today})
+            if self.gui_ready and self.virtual_list.active:
+                self.virtual_list.refresh()
+            elif self.gui_ready:
+                row = self.habit_rows[mode].get(habit_id)
+                if row:
+                    self.refresh_habit_row(row, habit, mode)
         except Exception as e:
             print(f"Error toggling completion: {e}")
             if self.root:
@@ -478,16 +2989,140 @@ class HabitTrackerApp:
     def delete_habit(self, habit_id):
         """Delete a habit from the list."""
         try:
-            habits = self.each_time_habits if self.increment_mode == 'each_time' else self.daily_habits
-            habits[:] = [h for h in habits if h["id"] != habit_id]
-            self.save_habits()
-            if self.root:
+            habit, mode = self.registry.remove(habit_id)
+            if habit is None:
+                return
+            self.record_event({"op": "delete", "id": habit.id})
+            if self.root and (self.virtual_list.active or self.registry.count(mode) > VIRTUAL_LIST_THRESHOLD):
                 self.render_habits()
+            elif self.root:
+                self.remove_habit_row(habit_id, mode)
         except Exception as e:
             print(f"Error deleting habit: {e}")
             if self.root:
                 messagebox.showerror("Error", "Failed to delete habit")
 
+    def find_habit(self, key):
+        """Return (habit, mode) for a habit id or exact habit text, or (None, None)."""
+        habit, mode = self.registry.get(habit_uid(key))
+        if habit is not None:
+            return habit, mode
+        for mode, habits in (('each_time', self.each_time_habits), ('same_day', self.daily_habits)):
+            for habit in habits:
+                if habit.text == key:
+                    return habit, mode
+        return None, None
+
+    def mark_completed(self, habit, mode, day, record=True):
+        """Record a completion of habit on day (an ISO date); return whether its history changed.
+
+        Daily habits count a day once, so completing one again changes nothing.
+        """
+        index = self.completion_index(habit)
+        ordinal = iso_to_ordinal(day)
+        changed = mode == 'each_time' or ordinal not in index
+        if changed:
+            habit.add_completion(ordinal)
+        if mode == 'same_day' and day == self.today:
+            habit.completed = True
+            habit.last_completed = day
+        if record:
+            self.record_event({"op": "complete", "id": habit.id, "date": day})
+        return changed
+
+    @instruments.timed('import')
+    def import_completions(self, lines, fmt, default_mode='same_day'):
+        """Read CSV or NDJSON completion records, then apply and save them all at once.
+
+        Each record names a habit (id or text), a date and optionally a count
+        and a mode; unknown habits are created. A CSV file starts with a header
+        naming its columns. Every record is checked before anything changes,
+        so a bad one, or one dated after today, leaves the store untouched: a
+        ValueError lists each bad record as "line N: <error>". Nothing is
+        logged per record: each habit's new dates become one "import" event,
+        and the save worker writes them all with one append (one transaction
+        in SQLite). Logging events rather than a snapshot keeps concurrent
+        writers' changes. Returns (completions imported, completions skipped
+        because a daily habit already had that day).
+        """
+        parsed, errors = [], []
+        if fmt == "csv":
+            reader = csv.DictReader(lines)
+            columns = reader.fieldnames or []
+            if columns and ("date" not in columns or not {"habit", "id"} & set(columns)):
+                raise ValueError(f"line 1: the CSV header must name a habit (or id) column and a date "
+                                 f"column, not {', '.join(columns)}")
+            numbered = ((reader.line_num, record) for record in reader)
+        else:
+            numbered = ((n, line) for n, line in enumerate(lines, 1) if line.strip())
+        for line_no, record in numbered:
+            try:
+                if fmt != "csv":
+                    record = json.loads(record)
+                    if not isinstance(record, dict):
+                        raise ValueError("record must be a JSON object")
+                key = record.get("habit") or record.get("id")
+                if not key:
+                    raise ValueError("record names no habit")
+                if not record.get("date"):
+                    raise ValueError("record has no date")
+                day = date.fromisoformat(str(record["date"]).strip()).isoformat()
+                if day > self.today:
+                    raise ValueError(f"date {day} is in the future")
+                count = int(record.get("count") or 1)
+                if count < 1:
+                    raise ValueError(f"count must be a positive integer, not {count}")
+                parsed.append((str(key), day, count, record.get("mode")))
+            except (ValueError, TypeError) as e:
+                errors.append(f"line {line_no}: {e}")
+        if errors:
+            raise ValueError("\n".join(errors))
+
+        imported = skipped = 0
+        known = {}  # Record key -> (habit, mode), so each habit is looked up once
+        new_dates = {}  # habit uid -> (habit, imported ISO dates)
+        for key, day, count, mode_name in parsed:
+            habit, mode = known.get(key) or self.find_habit(key)
+            if habit is None:
+                mode = 'each_time' if mode_name in ('each_time', 'each-time') else default_mode
+                habit = self.create_habit(key, mode)
+            known[key] = (habit, mode)
+            days = new_dates.setdefault(habit.uid, (habit, []))[1]
+            for _ in range(count):
+                if self.mark_completed(habit, mode, day, record=False):
+                    days.append(day)
+                    imported += 1
+                else:
+                    skipped += 1
+        for habit, days in new_dates.values():
+            if days:
+                self.record_event({"op": "import", "id": habit.id, "dates": days})
+        return imported, skipped
+
+    def export_habits(self, out, fmt):
+        """Write all habits as a habits.json document, or one completion record per day (CSV/NDJSON)."""
+        for habit in self.each_time_habits + self.daily_habits:
+            self.ensure_history(habit)
+        if fmt == "json":
+            json.dump({
+                'each_time_habits': [h.to_dict() for h in self.each_time_habits],
+                'daily_habits': [h.to_dict() for h in self.daily_habits]
+            }, out, indent=2)
+            out.write("\n")
+            return
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer:
+            writer.writerow(["id", "habit", "mode", "date", "count"])
+        for mode, habits in (('each_time', self.each_time_habits), ('same_day', self.daily_habits)):
+            for habit in habits:
+                index = self.completion_index(habit)
+                for ordinal, count in zip(index.ordinals, index.counts):
+                    row = [habit.id, habit.text, mode, ordinal_to_iso(ordinal), count]
+                    if writer:
+                        writer.writerow(row)
+                    else:
+                        out.write(json.dumps(dict(zip(("id", "habit", "mode", "date", "count"), row))) + "\n")
+
     def run_console_mode(self):
         """Run the app in console mode if GUI is not available."""
         while True:
@@ -505,13 +3140,15 @@ class HabitTrackerApp:
                 print("Exiting.")
                 break
 
+            self.roll_over_day()
+            self.poll_external_changes()
             habits = self.each_time_habits if self.increment_mode == 'each_time' else self.daily_habits
             if choice == "1":
                 if not habits:
                     print("No habits found.")
                 for i, h in enumerate(habits, 1):
-                    status = "✔" if h["completed"] and self.increment_mode == 'same_day' else " "
-                    print(f"{i}. {h['text']} [{status}]")
+                    status = "✔" if h.completed and self.increment_mode == 'same_day' else " "
+                    print(f"{i}. {h.text} [{status}]")
             elif choice == "2":
                 try:
                     habit_text = input("Enter habit: ").strip()
@@ -523,11 +3160,11 @@ class HabitTrackerApp:
                     print("No habits to complete.")
                 else:
                     for i, h in enumerate(habits, 1):
-                        print(f"{i}. {h['text']}")
+                        print(f"{i}. {h.text}")
                     try:
                         idx = int(input("Enter habit number: ")) - 1
                         if 0 <= idx < len(habits):
-                            self.toggle_habit_completion(habits[idx]["id"])
+                            self.toggle_habit_completion(habits[idx].uid)
                             print("Habit status updated.")
                         else:
                             print("Invalid number.")
@@ -538,34 +3175,29 @@ class HabitTrackerApp:
                     print("No habits to delete.")
                 else:
                     for i, h in enumerate(habits, 1):
-                        print(f"{i}. {h['text']}")
+                        print(f"{i}. {h.text}")
                     try:
                         idx = int(input("Enter habit number: ")) - 1
                         if 0 <= idx < len(habits):
-                            self.delete_habit(habits[idx]["id"])
+                            self.delete_habit(habits[idx].uid)
                             print("Habit deleted.")
                         else:
                             print("Invalid number.")
                     except ValueError:
                         print("Invalid input.")
             elif choice == "5":
+                stats = self.analytics()
                 print("\nHabit Completion Stats:")
-                print("Each Time Mode:")
-                if not self.each_time_habits:
-                    print("  No habits")
-                for i, h in enumerate(self.each_time_habits, 1):
-                    print(f"  {i}. {h['text']}: {h['completionCount']} times")
-                    dates = sorted(set(h.get('completionDates', [])))
-                    if dates:
-                        print(f"    Dates: {', '.join(dates)}")
-                print("Daily Mode:")
-                if not self.daily_habits:
-                    print("  No habits")
-                for i, h in enumerate(self.daily_habits, 1):
-                    print(f"  {i}. {h['text']}: {h['completionCount']} times")
-                    dates = sorted(set(h.get('completionDates', [])))
-                    if dates:
-                        print(f"    Dates: {', '.join(dates)}")
+                for mode_name, mode_habits in (("Each Time Mode", self.each_time_habits), ("Daily Mode", self.daily_habits)):
+                    print(f"{mode_name}:")
+                    if not mode_habits:
+                        print("  No habits")
+                    for i, h in enumerate(mode_habits, 1):
+                        print(f"  {i}. {h.text}: {h.completion_count} times")
+                        if stats:
+                            print(f"    {describe_stats(stats[h.uid])}")
+                if stats is None:
+                    print("Install numpy to see streaks and completion rates.")
             elif choice == "6":
                 self.toggle_increment_mode()
             elif choice == "7":
@@ -573,15 +3205,427 @@ class HabitTrackerApp:
                 break
             else:
                 print("Invalid option.")
+        self.close_storage()
+
+class HabitApiServer:
+    """Local HTTP/JSON API over a HabitTrackerApp, served by asyncio on one thread.
+
+    Endpoints: GET/POST /habits, GET/DELETE /habits/<id>, POST
+    /habits/<id>/complete, GET /stats and GET /status. Requests run one at a
+    time on the event loop, so the app needs no locking; changes go through
+    the app's event log and save worker, which coalesces every change
+    arriving within its debounce window into one append. GET responses under
+    /habits and /stats carry an ETag built from the app's data version and
+    today's date, and an If-None-Match hit is answered with 304 without
+    building the body; /status reports live counters and is never cached.
+    Connections are kept alive between requests. With a token, requests must
+    send "Authorization: Bearer <token>".
+    """
+
+    MODES = {'same_day': "daily", 'each_time': "each-time"}
+    VERSIONED = ("habits", "stats")  # Resources that only change with the data version or the day
+
+    def __init__(self, app, token=None):
+        self.app = app
+        self.token = token
+        self.boot = uuid.uuid4().hex[:8]  # Keeps ETags from an earlier run from matching
+        self.bodies = {}  # GET target -> encoded body, for the current ETag only
+        self.bodies_etag = None
+        self.requests = 0
+
+    def habit_json(self, habit, mode):
+        return {
+            "id": habit.id,
+            "text": habit.text,
+            "mode": self.MODES[mode],
+            "completed": habit.completed,
+            "lastCompleted": habit.last_completed,
+            "completionCount": habit.completion_count
+        }
+
+    def etag(self):
+        return f'"{self.boot}-{self.app.data_version}-{self.app.today}"'
+
+    def lookup(self, habit_id):
+        habit, mode = self.app.registry.get(habit_uid(habit_id))
+        if habit is None:
+            raise LookupError(f"No habit with id {habit_id}")
+        return habit, mode
+
+    def route(self, method, path, query, body):
+        """Run one request against the app; returns (status, payload or None)."""
+        app = self.app
+        parts = [part for part in path.split("/") if part]
+        if parts == ["habits"] and method == "GET":
+            modes = [mode for mode, name in self.MODES.items() if query.get("mode", name) == name]
+            return 200, [self.habit_json(h, mode) for mode in modes for h in app.registry.habits(mode)]
+        if parts == ["habits"] and method == "POST":
+            text = str(body.get("text", "")).strip()
+            if not text:
+                raise ValueError("text is required")
+            mode = 'each_time' if body.get("mode") == "each-time" else 'same_day'
+            return 201, self.habit_json(app.create_habit(text, mode), mode)
+        if len(parts) == 2 and parts[0] == "habits" and method in ("GET", "DELETE"):
+            habit, mode = self.lookup(parts[1])
+            if method == "DELETE":
+                app.delete_habit(habit.uid)
+                return 204, None
+            return 200, self.habit_json(habit, mode)
+        if len(parts) == 3 and parts[0] == "habits" and parts[2] == "complete" and method == "POST":
+            habit, mode = self.lookup(parts[1])
+            day = date.fromisoformat(body["date"]).isoformat() if body.get("date") else app.today
+            if day > app.today:
+                raise ValueError(f"date {day} is in the future")
+            count = int(body.get("count", 1))
+            if not 1 <= count <= 1000:
+                raise ValueError("count must be between 1 and 1000")
+            for _ in range(count if mode == 'each_time' else 1):
+                app.mark_completed(habit, mode, day)
+            return 200, self.habit_json(habit, mode)
+        if parts == ["stats"] and method == "GET":
+            stats = app.analytics() or {}
+            return 200, [
+                dict(self.habit_json(h, mode), **stats.get(h.uid, {}))
+                for mode in self.MODES for h in app.registry.habits(mode)
+            ]
+        if parts == ["status"] and method == "GET":
+            return 200, {
+                "habits": len(app.registry),
+                "dataVersion": app.data_version,
+                "requests": self.requests,
+                "diskWrites": app.saver.disk_writes
+            }
+        if parts and parts[0] in ("habits", "stats", "status"):
+            return 405, {"error": f"{method} is not allowed on {path}"}
+        return 404, {"error": f"Nothing at {path}"}
+
+    def respond(self, method, target, headers, raw_body):
+        """Return (status, body bytes, extra headers) for one parsed request."""
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            return 401, b'{"error":"missing or wrong token"}', {}
+        self.app.roll_over_day()
+        import urllib.parse
+        url = urllib.parse.urlsplit(target)
+        cached = method == "GET" and url.path.strip("/").split("/")[0] in self.VERSIONED
+        if cached:
+            etag = self.etag()
+            if headers.get("if-none-match") == etag:
+                return 304, b"", {"ETag": etag}
+            if self.bodies_etag == etag and target in self.bodies:
+                return 200, self.bodies[target], {"ETag": etag}
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+            status, payload = self.route(method, url.path, query, body)
+        except LookupError as e:
+            status, payload = 404, {"error": str(e).strip("'")}
+        except (ValueError, TypeError) as e:
+            status, payload = 400, {"error": str(e)}
+        encoded = b"" if payload is None else json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        if not cached or status != 200:
+            return status, encoded, {}
+        etag = self.etag()
+        if self.bodies_etag != etag:
+            self.bodies, self.bodies_etag = {}, etag
+        if len(self.bodies) < API_CACHED_BODIES:
+            self.bodies[target] = encoded
+        return status, encoded, {"ETag": etag}
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it or asks to."""
+        import asyncio
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 431, b'{"error":"headers too large"}', {}, False)
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self.send(writer, 400, b'{"error":"bad request line"}', {}, False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self.send(writer, 400, b'{"error":"bad Content-Length"}', {}, False)
+                    return
+                if "transfer-encoding" in headers or length > API_MAX_BODY:
+                    await self.send(writer, 413, b'{"error":"send a Content-Length body of at most 1 MiB"}', {}, False)
+                    return
+                raw_body = await reader.readexactly(length) if length else b""
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                self.requests += 1
+                try:
+                    status, body, extra = self.respond(method, target, headers, raw_body)
+                except Exception as e:
+                    print(f"Error handling {method} {target}: {e}")
+                    status, body, extra = 500, b'{"error":"internal error"}', {}
+                await self.send(writer, status, body, extra, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, body, extra, keep_alive):
+        import http
+        head = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"]
+        if status != 304 and status != 204:
+            head.append("Content-Type: application/json")
+            head.append(f"Content-Length: {len(body)}")
+        head.extend(f"{name}: {value}" for name, value in extra.items())
+        head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def poll_external_changes(self, loop):
+        """Pick up changes other processes made to the store, like the window's timer does."""
+        self.app.poll_external_changes()
+        loop.call_later(EXTERNAL_POLL_MS / 1000, self.poll_external_changes, loop)
+
+    async def serve(self, host, port):
+        import asyncio
+        import signal
+        server = await asyncio.start_server(self.handle, host, port)
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Serving habits on http://{host}:{port}", flush=True)
+        loop = asyncio.get_running_loop()
+        self.poll_external_changes(loop)
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):  # Windows: Ctrl+C raises KeyboardInterrupt
+                pass
+        async with server:
+            await stop.wait()
+
+
+def run_api_server(host, port, storage, save_debounce, token=None, directory="."):
+    """Serve the HTTP API until interrupted or terminated, then flush pending changes."""
+    import asyncio  # Only the API needs it, and it is slow to import
+    app = HabitTrackerApp(None, save_debounce, storage, interactive=False, directory=directory)
+    try:
+        asyncio.run(HabitApiServer(app, token).serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.close_storage()
+    return 0
+
+
+def run_team_command(args):
+    """Print aggregate stats over the users named in args (all users by default)."""
+    users = args.users or list_users(args.data_dir)
+    try:
+        missing = [u for u in users if not os.path.isdir(user_dir(args.data_dir, u))]
+    except ValueError as e:
+        print(e)
+        return 1
+    if missing:
+        print(f"No habits for {', '.join(missing)} in {os.path.join(args.data_dir, USERS_DIR)}")
+        return 1
+    started = time.perf_counter()
+    day = date.fromisoformat(args.date) if args.date else None
+    team = aggregate_users(args.data_dir, args.storage, users, args.days, day, args.jobs, args.top)
+    if args.json:
+        print(json.dumps(team, indent=2))
+        return 0
+    print(f"{team['users']} users, {team['habits']} habits, {team['start']} to {team['end']}: "
+          f"{team['completions']} completions, {team['completion_rate']:.0%} done "
+          f"({time.perf_counter() - started:.2f}s)")
+    for rank, row in enumerate(team["leaderboard"], 1):
+        print(f"{rank:>3}. {row['user']}: {row['completion_rate']:.0%} of {row['habits']} habits, "
+              f"{row['completions']} completions, current streak {row['current_streak']}")
+    if team["shared_habits"]:
+        print("Shared habits:")
+        for row in team["shared_habits"]:
+            print(f"    {row['habit']} ({row['users']} users): {row['completion_rate']:.0%}")
+    return 0
+
+
+def run_batch_command(args):
+    """Run one headless CLI subcommand against the habit store and return an exit code."""
+    app = HabitTrackerApp(None, args.save_debounce, args.storage, interactive=False, directory=args.directory)
+    try:
+        if args.command == "add":
+            app.increment_mode = 'each_time' if args.mode == 'each-time' else 'same_day'
+            app.add_habit(args.text)
+        elif args.command in ("complete", "delete"):
+            habit, mode = app.find_habit(args.habit)
+            if habit is None:
+                print(f"No habit named {args.habit!r}")
+                return 1
+            if args.command == "delete":
+                app.increment_mode = mode
+                app.delete_habit(habit.uid)
+                print("Habit deleted.")
+            else:
+                day = date.fromisoformat(args.date).isoformat() if args.date else app.today
+                if day > app.today:
+                    print(f"Cannot complete a habit on {day}: that date is in the future")
+                    return 1
+                app.mark_completed(habit, mode, day)
+                print("Habit status updated.")
+        elif args.command == "stats":
+            stats = app.analytics() or {}
+            rows = []
+            for mode, habits in (('each_time', app.each_time_habits), ('same_day', app.daily_habits)):
+                for habit in habits:
+                    rows.append(dict(
+                        {"id": habit.id, "habit": habit.text, "mode": mode,
+                         "completionCount": habit.completion_count},
+                        **stats.get(habit.uid, {})
+                    ))
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            else:
+                for row in rows:
+                    print(f"{row['habit']} ({row['mode']}): {row['completionCount']} times")
+                    if "current_streak" in row:
+                        print(f"    {describe_stats(row)}")
+        elif args.command == "export":
+            if args.output:
+                with open(args.output, "w", newline="") as out:
+                    app.export_habits(out, args.format)
+            else:
+                app.export_habits(sys.stdout, args.format)
+        elif args.command == "report":
+            if lazy_import("matplotlib.figure") is None:
+                print("Install matplotlib to render reports")
+                return 1
+            started = time.perf_counter()
+            day = date.fromisoformat(args.date) if args.date else None
+            written = render_report(app, args.output, args.format, args.jobs, day)
+            if not written:
+                print("No habits to report")
+                return 0
+            print(f"Wrote {len(written)} {args.format.upper()} file(s) to {args.output} "
+                  f"in {time.perf_counter() - started:.2f}s")
+        elif args.command == "import":
+            fmt = args.format or ("csv" if args.file.endswith(".csv") else "ndjson")
+            default_mode = 'each_time' if args.mode == 'each-time' else 'same_day'
+            started = time.perf_counter()
+            try:
+                if args.file == "-":
+                    imported, skipped = app.import_completions(sys.stdin, fmt, default_mode)
+                else:
+                    with open(args.file, newline="") as lines:
+                        imported, skipped = app.import_completions(lines, fmt, default_mode)
+            except ValueError as e:
+                print(f"Nothing imported; fix these records first:\n{e}")
+                return 1
+            print(f"Imported {imported} completions in {time.perf_counter() - started:.2f}s")
+            if skipped:
+                print(f"Skipped {skipped} completions of daily habits already done on that day")
+        return 0
+    finally:
+        app.close_storage()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Habit Tracker")
+    parser.add_argument("--console", action="store_true", help="run the console menu instead of the GUI")
+    parser.add_argument("--tray", action="store_true", help="start hidden in the system tray")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json",
+                        help="keep habits in habits.json with an event log, or in habits.db")
+    parser.add_argument("--data-dir", default=os.environ.get(DATA_DIR_ENV_VAR, "."), metavar="DIR",
+                        help=f"directory holding the habit files (default: ${DATA_DIR_ENV_VAR} or the current directory)")
+    parser.add_argument("--user", metavar="NAME",
+                        help=f"open this user's habits, kept in DIR/{USERS_DIR}/NAME (default: the files in DIR)")
+    parser.add_argument("--save-debounce", type=float, default=SAVE_DEBOUNCE_SECONDS, metavar="SECONDS",
+                        help="coalesce changes made within this window into one disk write")
+    parser.add_argument("--profile", nargs="?", const="spans", metavar="OPTIONS",
+                        help="time hot paths and count writes; add cpu and/or memory (e.g. cpu,memory) "
+                             f"for cProfile and tracemalloc. Press F12 for the debug panel. Also {PROFILE_ENV_VAR}")
+    parser.add_argument("--profile-out", default=PROFILE_FILE, metavar="FILE",
+                        help="where the profile is written as JSON on exit")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND",
+                                     help="run one command without the GUI or console menu")
+    command = commands.add_parser("add", help="add a habit")
+    command.add_argument("text")
+    command.add_argument("--mode", choices=["daily", "each-time"], default="daily")
+    command = commands.add_parser("complete", help="record a completion")
+    command.add_argument("habit", help="habit id or text")
+    command.add_argument("--date", help="ISO date to backfill (default: today)")
+    command = commands.add_parser("delete", help="delete a habit")
+    command.add_argument("habit", help="habit id or text")
+    command = commands.add_parser("stats", help="print completion stats")
+    command.add_argument("--json", action="store_true", help="print machine-readable stats")
+    command = commands.add_parser("export", help="export habits or completion records")
+    command.add_argument("--format", choices=["json", "csv", "ndjson"], default="json")
+    command.add_argument("-o", "--output", help="file to write (default: stdout)")
+    command = commands.add_parser("report", help="render every habit's weekly chart and month calendar to files")
+    command.add_argument("output", help="directory for PNG/SVG files, or the PDF file")
+    command.add_argument("--format", choices=["png", "svg", "pdf"], default="png")
+    command.add_argument("--jobs", type=int, help="worker processes (default: one per core)")
+    command.add_argument("--date", help="ISO date whose week and month are reported (default: today)")
+    command = commands.add_parser("users", help="list the users with habits in the data directory")
+    command = commands.add_parser("team", help="completion rates, a leaderboard and shared habits across users")
+    command.add_argument("users", nargs="*", metavar="USER", help="users to include (default: all)")
+    command.add_argument("--days", type=int, default=30, help="length of the window ending on --date")
+    command.add_argument("--date", help="ISO date the window ends on (default: today)")
+    command.add_argument("--jobs", type=int, help="worker processes (default: one per core)")
+    command.add_argument("--top", type=int, default=10, help="rows in the leaderboard and shared habit lists")
+    command.add_argument("--json", action="store_true", help="print machine-readable stats")
+    command = commands.add_parser("serve", help="serve the habits over a local HTTP/JSON API")
+    command.add_argument("--host", default="127.0.0.1", help="address to listen on (0.0.0.0 for the whole LAN)")
+    command.add_argument("--port", type=int, default=API_PORT)
+    command.add_argument("--token", help="require 'Authorization: Bearer TOKEN' on every request")
+    command = commands.add_parser("import", help="bulk import completion records with a single save")
+    command.add_argument("file", help="CSV (habit,date[,count][,mode]) or NDJSON file, - for stdin")
+    command.add_argument("--format", choices=["csv", "ndjson"])
+    command.add_argument("--mode", choices=["daily", "each-time"], default="daily",
+                         help="mode for habits the import creates")
+    args = parser.parse_args()
+    try:
+        args.directory = user_dir(args.data_dir, args.user)
+    except ValueError as e:
+        parser.error(str(e))
+    if getattr(args, "date", None):
+        try:
+            date.fromisoformat(args.date)
+        except ValueError:
+            parser.error(f"--date must be an ISO date like 2024-01-31, not {args.date!r}")
+    if args.profile:
+        instruments.enable(args.profile, args.profile_out)
+
+    if args.command == "users":
+        print("\n".join(list_users(args.data_dir)) or f"No users in {os.path.join(args.data_dir, USERS_DIR)}")
+        sys.exit(0)
+    if args.command == "team":
+        sys.exit(run_team_command(args))
+    if args.command == "serve":
+        sys.exit(run_api_server(args.host, args.port, args.storage, args.save_debounce, args.token, args.directory))
+    if args.command:
+        sys.exit(run_batch_command(args))
+    if args.console:
+        app = HabitTrackerApp(None, args.save_debounce, args.storage, directory=args.directory)
+        sys.exit(0)
     try:
         root = tk.Tk()
-        app = HabitTrackerApp(root)
+        app = HabitTrackerApp(root, args.save_debounce, args.storage, start_in_tray=args.tray,
+                              directory=args.directory)
         root.mainloop()
     except Exception as e:
         if "no display name" in str(e) or "DISPLAY" in str(e):
             print("No display available. Running in console mode.")
-            app = HabitTrackerApp(None)
+            app = HabitTrackerApp(None, args.save_debounce, args.storage, directory=args.directory)
         else:
-            print(f"Failed to start: {e}")
\ No newline at end of file
+            print(f"Failed to start: {e}")
@@ -0,0 +1,23 @@
+"""Loads habit tracker.py, whose file name is not importable, as the module habit_tracker."""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "habit tracker.py")
+
+if "habit_tracker" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("habit_tracker", APP_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["habit_tracker"] = module
+    spec.loader.exec_module(module)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A headless app over an empty store in a temporary data directory."""
+    from habit_tracker import HabitTrackerApp
+    app = HabitTrackerApp(None, 0, "json", interactive=False, directory=str(tmp_path))
+    yield app
+    app.close_storage()
@@ -0,0 +1,53 @@
+"""CompletionIndex histories survive encode and decode in both stored forms."""
+import random
+
+import pytest
+
+from habit_tracker import CompletionIndex, ordinal_to_iso
+
+START = 739000
+
+
+def round_trip(index):
+    encoded = index.encode()
+    assert CompletionIndex.decode(encoded) == index
+    return encoded
+
+
+def test_empty_history_encodes_as_empty_dict():
+    assert round_trip(CompletionIndex()) == {}
+    assert len(CompletionIndex.decode({})) == 0
+
+
+@pytest.mark.parametrize("days", [[0], [0, 7], [0, 8], list(range(16)), [0, 2, 3, 9, 31, 32, 33, 100]])
+def test_single_completions_on_dense_days_use_a_bitmap(days):
+    encoded = round_trip(CompletionIndex(START + d for d in days))
+    assert set(encoded) == {"start", "days"}
+    assert encoded["start"] == ordinal_to_iso(START)
+
+
+def test_repeat_completions_use_runs():
+    index = CompletionIndex.from_counts({START: 1, START + 1: 4, START + 5: 1})
+    assert round_trip(index) == {"start": ordinal_to_iso(START), "runs": [0, 1, 1, 4, 4, 1]}
+
+
+def test_sparse_single_completions_use_runs():
+    encoded = round_trip(CompletionIndex([START, START + 400]))
+    assert "runs" in encoded
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_histories_round_trip(seed):
+    rng = random.Random(seed)
+    days = rng.sample(range(2000), rng.randint(1, 300))
+    counts = {START + d: rng.choice([1, 1, 1, 2, 9]) if seed % 2 else 1 for d in days}
+    index = CompletionIndex.from_counts(counts)
+    round_trip(index)
+    assert index.total() == sum(counts.values())
+
+
+def test_legacy_completion_dates_match_the_encoded_history():
+    dates = [ordinal_to_iso(START + d) for d in (5, 1, 1, 3)]
+    index = CompletionIndex.from_habit({"completionDates": dates})
+    assert CompletionIndex.from_habit({"history": index.encode()}) == index
+    assert index.count(START + 1) == 2
@@ -0,0 +1,100 @@
+"""EventLogStore replay of damaged logs and of a compaction cut short."""
+import json
+import os
+
+from habit_tracker import HABITS_FILE, HABITS_LOG_FILE, EventLogStore
+
+
+def open_store(directory):
+    store = EventLogStore(str(directory / HABITS_FILE), str(directory / HABITS_LOG_FILE), lazy_history=False)
+    store.load()
+    return store
+
+
+def load(directory):
+    """Data as a fresh process would load it, after any compaction it starts has finished."""
+    store = EventLogStore(str(directory / HABITS_FILE), str(directory / HABITS_LOG_FILE), lazy_history=False)
+    data = store.load()
+    if store._compactor:
+        store._compactor.join()
+    store.close()
+    return data
+
+
+def add_event(habit_id):
+    return {"op": "add", "mode": "each_time", "habit": {"id": habit_id, "text": habit_id, "history": {}}}
+
+
+def habit_ids(data):
+    return [h["id"] for h in data["each_time_habits"]]
+
+
+def write_events(directory, *habit_ids):
+    store = open_store(directory)
+    store.write_lines([store.encode(add_event(i)) for i in habit_ids])
+    store.close()
+
+
+def test_torn_tail_is_ignored_and_cut_off_by_the_next_append(tmp_path):
+    write_events(tmp_path, "a", "b")
+    log = tmp_path / HABITS_LOG_FILE
+    with open(log, "ab") as f:
+        f.write(b'{"seq":3,"op":"add","mo')
+
+    store = open_store(tmp_path)
+    assert store.seq == 2
+    store.write_lines([store.encode(add_event("c"))])
+    store.close()
+
+    lines = log.read_bytes().split(b"\n")
+    assert lines[-1] == b""
+    assert [json.loads(line)["seq"] for line in lines[:-1]] == [1, 2, 3]
+    assert habit_ids(load(tmp_path)) == ["a", "b", "c"]
+
+
+def test_corrupt_middle_line_is_skipped_without_losing_later_events(tmp_path, capsys):
+    write_events(tmp_path, "a", "b", "c")
+    log = tmp_path / HABITS_LOG_FILE
+    lines = log.read_bytes().split(b"\n")
+    lines[1] = b'{"seq":2,"op":\r"add'
+    log.write_bytes(b"\n".join(lines))
+
+    store = open_store(tmp_path)
+    assert "skipping corrupt line" in capsys.readouterr().out
+    store.write_lines([store.encode(add_event("d"))])
+    store.close()
+
+    assert b'"id":"c"' in log.read_bytes()
+    assert habit_ids(load(tmp_path)) == ["a", "c", "d"]
+
+
+def test_crash_after_rotating_replays_and_folds_the_rotated_log(tmp_path):
+    write_events(tmp_path, "a", "b")
+    os.replace(tmp_path / HABITS_LOG_FILE, tmp_path / (HABITS_LOG_FILE + ".1"))
+    assert not (tmp_path / HABITS_FILE).exists()
+
+    store = open_store(tmp_path)
+    store._compactor.join()
+    store.write_lines([store.encode(add_event("c"))])
+    store.close()
+
+    assert not (tmp_path / (HABITS_LOG_FILE + ".1")).exists()
+    assert json.loads((tmp_path / HABITS_FILE).read_text())["logSeq"] == 2
+    assert habit_ids(load(tmp_path)) == ["a", "b", "c"]
+
+
+def test_crash_after_snapshot_does_not_replay_folded_events_twice(tmp_path):
+    write_events(tmp_path, "a")
+    store = open_store(tmp_path)
+    store.write_lines([store.encode({"op": "complete", "id": "a", "date": "2026-01-05"})])
+    store.close()
+    rotated = tmp_path / (HABITS_LOG_FILE + ".1")
+    os.replace(tmp_path / HABITS_LOG_FILE, rotated)
+    folded = rotated.read_bytes()
+    store = open_store(tmp_path)
+    store._compactor.join()
+    store.close()
+    rotated.write_bytes(folded)  # The snapshot was replaced but the rotated log never removed
+
+    data = load(tmp_path)
+    assert data["each_time_habits"][0]["completionCount"] == 1
@@ -0,0 +1,60 @@
+"""Bulk import of completion records: validation, counting and what reaches the store."""
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from habit_tracker import HabitTrackerApp
+
+
+def days_ago(app, days):
+    return (date.fromisoformat(app.today) - timedelta(days=days)).isoformat()
+
+
+def run_import(app, text, fmt="csv"):
+    return app.import_completions(io.StringIO(text), fmt)
+
+
+def test_counts_only_completions_that_change_a_habit(app):
+    day = days_ago(app, 3)
+    text = f"habit,date,count,mode\nRead,{day},2,\nRead,{day},1,\nRun,{day},3,each-time\n"
+    assert run_import(app, text) == (4, 2)
+    read, _ = app.find_habit("Read")
+    run, _ = app.find_habit("Run")
+    assert read.completion_count == 1
+    assert run.completion_count == 3
+
+
+def test_imported_completions_survive_a_restart(app, tmp_path):
+    text = "".join(f'{{"habit": "Read", "date": "{days_ago(app, n)}"}}\n' for n in (1, 2, 2))
+    assert run_import(app, text, "ndjson") == (2, 1)
+    app.close_storage()
+    reopened = HabitTrackerApp(None, 0, "json", interactive=False, directory=str(tmp_path))
+    try:
+        habit, mode = reopened.find_habit("Read")
+        assert mode == 'same_day'
+        assert habit.completion_count == 2
+    finally:
+        reopened.close_storage()
+
+
+def test_headerless_csv_is_rejected(app):
+    with pytest.raises(ValueError, match="header"):
+        run_import(app, f"Read,{app.today}\nRun,{app.today}\n")
+    assert len(app.registry) == 0
+
+
+def test_bad_records_are_listed_and_nothing_is_imported(app):
+    tomorrow = (date.fromisoformat(app.today) + timedelta(days=1)).isoformat()
+    text = f"habit,date,count\nRead,{app.today},1\n,{app.today},1\nRead,someday,1\nRead,{tomorrow},1\nRead,{app.today},0\n"
+    with pytest.raises(ValueError) as raised:
+        run_import(app, text)
+    errors = str(raised.value).splitlines()
+    assert [e.split(":")[0] for e in errors] == ["line 3", "line 4", "line 5", "line 6"]
+    assert "in the future" in errors[2]
+    assert len(app.registry) == 0
+
+
+def test_ndjson_record_must_be_an_object(app):
+    with pytest.raises(ValueError, match="line 2: record must be a JSON object"):
+        run_import(app, f'{{"habit": "Read", "date": "{app.today}"}}\n[1, 2]\n', "ndjson")
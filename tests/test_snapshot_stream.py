@@ -0,0 +1,66 @@
+"""Byte offsets reported while streaming a snapshot, which lazy history loading re-reads."""
+import io
+import json
+
+import pytest
+
+from habit_tracker import HABITS_FILE, HABITS_LOG_FILE, CompletionIndex, EventLogStore, JsonStream, iter_snapshot
+
+TEXTS = ['say "hi" \\ then ]}', "caf\u00e9 \u2615 \U0001f600", "tab\tnew\nline", "{[,:]}"]
+
+
+def snapshot_habits():
+    habits = []
+    for i, text in enumerate(TEXTS):
+        history = CompletionIndex.from_counts({739000 + 3 * d: 1 + (i + d) % 3 for d in range(40)})
+        habits.append({"id": f"id-{i}", "text": text, "completionCount": history.total(),
+                       "history": history.encode(), "extra": {"tags": [text, {"nested": [1, [2, 3]]}]}})
+    return habits
+
+
+def snapshot_bytes(ensure_ascii):
+    habits = snapshot_habits()
+    data = {"each_time_habits": habits[:2], "daily_habits": habits[2:], "logSeq": 12}
+    return json.dumps(data, ensure_ascii=ensure_ascii, indent=1).encode("utf-8"), habits
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_snapshot_offsets_span_each_habit(ensure_ascii):
+    raw, habits = snapshot_bytes(ensure_ascii)
+    items = list(iter_snapshot(io.BytesIO(raw)))
+    assert items[-1] == ("logSeq", 12)
+    found = items[:-1]
+    assert [item[1] for item in found] == ["each_time_habits"] * 2 + ["daily_habits"] * 2
+    for (_, _, habit, start, end), expected in zip(found, habits):
+        assert habit == expected
+        assert json.loads(raw[start:end]) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_offsets_hold_when_reads_split_values_and_characters(chunk_size):
+    habits = snapshot_habits()
+    raw = json.dumps(habits, ensure_ascii=False).encode("utf-8")
+    stream = JsonStream(io.BytesIO(raw), chunk_size=chunk_size)
+    items = list(stream.array_items())
+    assert [value for value, _, _ in items] == habits
+    assert [json.loads(raw[start:end]) for _, start, end in items] == habits
+    assert stream.peek() == ""
+
+
+def test_legacy_list_yields_daily_habits():
+    raw = json.dumps([{"id": "a", "text": "\u00e9\"]"}, {"bad": True}]).encode("utf-8")
+    assert [item[2]["id"] for item in iter_snapshot(io.BytesIO(raw))] == ["a"]
+
+
+def test_lazy_history_is_read_back_from_its_offsets(tmp_path):
+    raw, habits = snapshot_bytes(ensure_ascii=False)
+    (tmp_path / HABITS_FILE).write_bytes(raw)
+    store = EventLogStore(str(tmp_path / HABITS_FILE), str(tmp_path / HABITS_LOG_FILE), lazy_history=True)
+    data = store.load()
+    try:
+        loaded = data["each_time_habits"] + data["daily_habits"]
+        assert all("history" not in habit for habit in loaded)
+        for habit in reversed(habits):
+            assert store.load_history(habit["id"]) == CompletionIndex.decode(habit["history"])
+    finally:
+        store.close()